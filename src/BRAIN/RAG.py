@@ -1,46 +1,68 @@
-import os
-import shutil
-import tempfile
 from pathlib import Path
 
+import numpy as np
+
 from docling.datamodel.base_models import InputFormat
-from docling.datamodel.pipeline_options import PdfPipelineOptions
-from docling.document_converter import DocumentConverter, PdfFormatOption, WordFormatOption, SimplePipeline
-from langchain_community.document_loaders import UnstructuredMarkdownLoader
-from langchain.text_splitter import RecursiveCharacterTextSplitter
 from langchain_ollama import OllamaEmbeddings, OllamaLLM
 from langchain_community.vectorstores import FAISS
-from langchain.chains import ConversationalRetrievalChain
-from langchain_core.runnables.history import RunnableWithMessageHistory
-from langchain_community.chat_message_histories.in_memory import ChatMessageHistory
 from src.FUNCTION.Tools.get_env import EnvManager
+from src.BRAIN.batch_convert import convert_to_markdown, get_document_format
+from src.BRAIN.chunk_manifest import ChunkManifest
+from src.BRAIN.embedding_cache import CachedEmbeddings
+from src.BRAIN.embedding_pipeline import EmbeddingPipeline
+from src.BRAIN.markdown_chunker import MarkdownChunker
+from src.BRAIN.mmap_store import MmapVectorStore, byte_offsets, choose_index_type
+from src.BRAIN.lexical_index import BM25Index, HybridRetriever
+from src.BRAIN.rag_chain import RAGChain, is_standalone
+from src.BRAIN.summary_memory import SummaryBufferHistory
+from src.BRAIN.answer_cache import SemanticAnswerCache
+from src.BRAIN.context_compressor import ContextCompressor
+from src.BRAIN.table_index import TableIndex
+from src.BRAIN.subject_router import CENTROID_FILE, ShardedRetriever, SubjectRouter, compute_centroid
 
 
 class RAGPipeline:
-    def __init__(self):
+    def __init__(self, embedder=None, embed_batch_size: int = 32, embed_workers: int = 4,
+                 retrieval_k: int = 2, rrf_k: int = 60, vector_weight: float = 1.0, lexical_weight: float = 1.0,
+                 chunk_size: int = 500, index_types: dict = None, memory_token_budget: int = 1000,
+                 context_token_budget: int = 400, llm=None, data_dir="./DATA"):
         self.embedding_model = EnvManager.load_variable("Embedding_model")
+        self.embedder = embedder  # Any langchain Embeddings; defaults to cached Ollama embeddings
+        self.embed_batch_size = embed_batch_size
+        self.embed_workers = embed_workers
+        self.chunk_size = chunk_size
+        self.index_types = index_types or {}  # subject -> "flat" | "hnsw" | "ivfpq" | "auto" (default)
+        self.retrieval_k = retrieval_k
+        self.rrf_k = rrf_k  # Reciprocal rank fusion constant
+        self.vector_weight = vector_weight
+        self.lexical_weight = lexical_weight
         self.rag_model = EnvManager.load_variable("Rag_model")
-        self.MAX_MESSAGES_PER_SESSION = 20
+        self.llm = llm  # Any langchain LLM; defaults to Ollama with rag_model
+        self.data_dir = Path(data_dir)
+        self.memory_token_budget = memory_token_budget  # Verbatim history per session; older turns get summarized
+        self.context_token_budget = context_token_budget  # Retrieved context above this is compressed; None disables
         self.qa_chain = None
         self.memory_store = {}  # In-memory store for session memory
+        self.last_index_report = None
+        self.answer_cache = None
+        self.router = None
+        self.last_routes = {}  # session_id -> subjects the previous question was routed to
+        self.routed_chains = {}  # subjects tuple -> (source chains, combined chain)
 
     def get_paths(self, subject: str):
         subject_clean = subject.lower().strip().replace(" ", "_")
-        doc_path = Path(f"./DATA/RAWKNOWLEDGEBASE/{subject_clean}_data.pdf")
-        md_path = Path(f"./DATA/KNOWLEDGEBASE/{subject_clean}_data_converted.md")
-        vectorstore_path = Path(f"./DATA/VECTORSTORES/{subject_clean}_vectorstore.pkl")
-        return doc_path, md_path, vectorstore_path
+        doc_path = self.data_dir / "RAWKNOWLEDGEBASE" / f"{subject_clean}_data.pdf"
+        md_path = self.data_dir / "KNOWLEDGEBASE" / f"{subject_clean}_data_converted.md"
+        index_path = self.data_dir / "VECTORSTORES" / f"{subject_clean}_index"
+        return doc_path, md_path, index_path
+
+    def get_legacy_vectorstore_path(self, subject: str):
+        """Pickled FAISS vectorstore written by earlier versions."""
+        subject_clean = subject.lower().strip().replace(" ", "_")
+        return self.data_dir / "VECTORSTORES" / f"{subject_clean}_vectorstore.pkl"
 
     def get_document_format(self, file_path) -> InputFormat:
-        ext = Path(file_path).suffix.lower()
-        return {
-            '.pdf': InputFormat.PDF,
-            '.docx': InputFormat.DOCX,
-            '.doc': InputFormat.DOCX,
-            '.pptx': InputFormat.PPTX,
-            '.html': InputFormat.HTML,
-            '.htm': InputFormat.HTML
-        }.get(ext, None)
+        return get_document_format(file_path)
 
     def convert_document_to_markdown(self, subject: str) -> bool:
         try:
@@ -49,76 +71,224 @@ class RAGPipeline:
                 print(f"No document found: {doc_path}")
                 return False
 
-            doc_format = self.get_document_format(doc_path)
-            if not doc_format:
+            if not self.get_document_format(doc_path):
                 print(f"Unsupported format: {doc_path.suffix}")
                 return False
 
-            input_path = os.path.abspath(str(doc_path))
-            with tempfile.TemporaryDirectory() as temp_dir:
-                temp_input = os.path.join(temp_dir, os.path.basename(input_path))
-                shutil.copy2(input_path, temp_input)
-
-                pipeline_options = PdfPipelineOptions(do_ocr=True, do_table_structure=True)
-                converter = DocumentConverter(
-                    allowed_formats=[doc_format],
-                    format_options={
-                        doc_format: PdfFormatOption(pipeline_options=pipeline_options),
-                        InputFormat.DOCX: WordFormatOption(pipeline_cls=SimplePipeline)
-                    }
-                )
-
-                conv_result = converter.convert(temp_input)
-                if not conv_result or not conv_result.document:
-                    print(f"Conversion failed for: {doc_path}")
-                    return False
-
-                markdown = conv_result.document.export_to_markdown()
-                md_path.parent.mkdir(parents=True, exist_ok=True)
-                with open(md_path, "w", encoding="utf-8") as f:
-                    f.write(markdown)
-                return True
+            markdown = convert_to_markdown(doc_path)
+            md_path.parent.mkdir(parents=True, exist_ok=True)
+            with open(md_path, "w", encoding="utf-8") as f:
+                f.write(markdown)
+            return True
         except Exception as e:
             print(f"[Conversion Error] {e}")
             return False
 
+    def collect_reusable_vectors(self, subject: str, chunk_hashes) -> dict:
+        """Vectors already embedded for any of `chunk_hashes`, read from the current index of the subject."""
+        _, _, index_path = self.get_paths(subject)
+        legacy_path = self.get_legacy_vectorstore_path(subject)
+        vectors = {}
+        if MmapVectorStore.exists(index_path):
+            manifest = ChunkManifest(MmapVectorStore.resolve(index_path) / ChunkManifest.FILE_NAME)
+            if manifest.embedding != self.embedding_signature():
+                # Embedded with another model (or one not recorded): its vectors would not be comparable.
+                return vectors
+            store = MmapVectorStore.load(index_path, self.get_embeddings(), verify_source=False)
+            try:
+                for chunk_hash in chunk_hashes:
+                    vector = store.get_vector(chunk_hash)
+                    if vector is not None:
+                        vectors[chunk_hash] = vector
+            finally:
+                store.close()
+        elif legacy_path.exists():
+            # Pickled FAISS stores with a manifest also used content hashes as ids; carry their vectors over.
+            legacy = FAISS.load_local(str(legacy_path), self.get_embeddings(), allow_dangerous_deserialization=True)
+            for row, chunk_id in legacy.index_to_docstore_id.items():
+                if chunk_id in chunk_hashes:
+                    vectors[chunk_id] = legacy.index.reconstruct(row)
+        return vectors
+
     def load_or_create_vectorstore(self, subject: str):
         try:
-            _, md_path, vectorstore_path = self.get_paths(subject)
-            vectorstore_path.parent.mkdir(parents=True, exist_ok=True)
-            embeddings = OllamaEmbeddings(model=self.embedding_model)
+            _, md_path, index_path = self.get_paths(subject)
+            index_path.parent.mkdir(parents=True, exist_ok=True)
+            embeddings = self.get_embeddings()
+            manifest = ChunkManifest(MmapVectorStore.resolve(index_path) / ChunkManifest.FILE_NAME)
+            source_stat = md_path.stat()
+            raw = md_path.read_bytes()
+            source_hash = ChunkManifest.hash_bytes(raw)
 
-            if vectorstore_path.exists():
-                print(f"Loading existing vectorstore from: {vectorstore_path}")
-                return FAISS.load_local(str(vectorstore_path), embeddings, allow_dangerous_deserialization=True)
+            chunker = MarkdownChunker(chunk_size=self.chunk_size)
+            embedding = self.embedding_signature()
+            if MmapVectorStore.exists(index_path) and manifest.is_current(source_hash, chunker.signature(), embedding):
+                store = MmapVectorStore.load(index_path, embeddings)
+                # Indexes written before chunks pointed into a copy of the source or tables were
+                # extracted are rewritten once; all their vectors are reused.
+                required = (MmapVectorStore.SOURCE_FILE, TableIndex.FILE_NAME)
+                up_to_date = all((store.path / name).exists() for name in required)
+                if store.index_type == self.get_index_type(subject, len(store.ids)) and up_to_date:
+                    print(f"Loading existing index from: {index_path}")
+                    return store
+                store.close()
 
-            print(f"Creating vectorstore for: {md_path}")
-            loader = UnstructuredMarkdownLoader(str(md_path))
-            documents = loader.load()
+            print(f"Indexing: {md_path}")
+            text = raw.decode("utf-8").replace("\r\n", "\n").replace("\r", "\n")  # As read_text() reads it
+            chunks = chunker.create_documents(text, source=str(md_path))
 
-            splitter = RecursiveCharacterTextSplitter(chunk_size=500, chunk_overlap=100)
-            chunks = splitter.split_documents(documents)
+            chunk_by_hash = {}
+            for chunk in chunks:
+                chunk_by_hash.setdefault(ChunkManifest.hash_text(chunk.page_content), chunk)
+
+            vectors = self.collect_reusable_vectors(subject, chunk_by_hash)
+            added = [h for h in chunk_by_hash if h not in vectors]
+            _, _, removed = manifest.diff(chunk_by_hash)
+
+            texts = [chunk_by_hash[h].page_content for h in added]
+            pipeline = EmbeddingPipeline(embeddings, batch_size=self.embed_batch_size, max_workers=self.embed_workers)
+            vectors.update(zip(added, pipeline.embed_documents(texts)))
+
+            ids = list(chunk_by_hash)
+            texts = [chunk_by_hash[h].page_content for h in ids]
+            lexical = BM25Index.build(texts)
+            manifest.update(source_hash, ids, chunker=chunker.signature(), embedding=embedding)
+            # Chunks are stored as byte ranges into the markdown itself rather than copied into the index.
+            chunk_offsets = [chunk_by_hash[h].metadata for h in ids]
+            to_bytes = byte_offsets(raw, [m[key] for m in chunk_offsets for key in ("start_index", "end_index")])
+            MmapVectorStore.write(
+                index_path,
+                ids=ids,
+                texts=texts,
+                vectors=[vectors[h] for h in ids],
+                metadatas=[chunk_by_hash[h].metadata for h in ids],
+                sidecars=[
+                    manifest.save,
+                    lambda directory: lexical.save(directory / BM25Index.FILE_NAME),
+                    lambda directory: np.save(directory / CENTROID_FILE, compute_centroid([vectors[h] for h in ids])),
+                    lambda directory: TableIndex.build(directory / TableIndex.FILE_NAME, text, chunker),
+                ],
+                index_type=self.get_index_type(subject, len(ids)),
+                source=MmapVectorStore.describe_source(md_path, source_hash, stat=source_stat),
+                spans=[(to_bytes[m["start_index"]], to_bytes[m["end_index"]]) for m in chunk_offsets],
+            )
 
-            vectorstore = FAISS.from_documents(chunks, embeddings)
-            vectorstore.save_local(str(vectorstore_path))
-            return vectorstore
+            reused = len(ids) - len(added)
+            self.last_index_report = {"reused": reused, "embedded": len(added), "removed": len(removed)}
+            if self.answer_cache:
+                self.answer_cache.invalidate(subject)
+            print(f"[Index] {subject}: reused {reused} chunks, re-embedded {len(added)}, removed {len(removed)}.")
+            return MmapVectorStore.load(index_path, embeddings)
         except Exception as e:
             print(f"[Vectorstore Error] {e}")
             return None
 
-    def get_memory(self, session_id: str):
-        if session_id not in self.memory_store:
-            self.memory_store[session_id] = ChatMessageHistory()
+    def index_version(self, subject: str):
+        """Version of the subject index on disk; changes whenever a rebuild is swapped in."""
+        _, _, index_path = self.get_paths(subject)
+        return MmapVectorStore.current_version(index_path)
+
+    def get_index_type(self, subject: str, n_chunks: int) -> str:
+        subject_clean = subject.lower().strip().replace(" ", "_")
+        return choose_index_type(self.index_types.get(subject_clean, "auto"), n_chunks)
+
+    def get_retriever(self, subject: str, vectorstore):
+        lexical_path = vectorstore.path / BM25Index.FILE_NAME
+        if lexical_path.exists():
+            lexical = BM25Index.load(lexical_path)
+        else:
+            lexical = BM25Index.build(vectorstore.get_text(row) for row in range(len(vectorstore.ids)))
+        return HybridRetriever(
+            vectorstore=vectorstore,
+            lexical=lexical,
+            k=self.retrieval_k,
+            fetch_k=max(10, self.retrieval_k * 4),
+            vector_weight=self.vector_weight,
+            lexical_weight=self.lexical_weight,
+            rrf_k=self.rrf_k,
+        )
+
+    def get_answer_cache(self):
+        if self.answer_cache is None:
+            self.answer_cache = SemanticAnswerCache(self.get_embeddings())
+        return self.answer_cache
+
+    def get_llm(self):
+        if self.llm is None:
+            self.llm = OllamaLLM(model=self.rag_model, temperature=0)
+        return self.llm
+
+    def get_compressor(self):
+        if self.context_token_budget is None:
+            return None
+        return ContextCompressor(self.get_embeddings(), token_budget=self.context_token_budget)
+
+    def get_embeddings(self):
+        if self.embedder is None:
+            self.embedder = CachedEmbeddings(OllamaEmbeddings(model=self.embedding_model), self.embedding_model)
+        return self.embedder
+
+    def embedding_signature(self) -> str:
+        """Name of the embedding model, recorded in the manifest so a model change rebuilds the index."""
+        embeddings = self.get_embeddings()
+        return getattr(embeddings, "model_name", None) or type(embeddings).__name__
+
+    def available_subjects(self):
+        """Subjects that have a converted knowledge base, in the cleaned form used for paths."""
+        suffix = "_data_converted.md"
+        return sorted(p.name[:-len(suffix)] for p in (self.data_dir / "KNOWLEDGEBASE").glob(f"*{suffix}"))
 
-        history = self.memory_store[session_id]
+    def get_router(self):
+        if self.router is None:
+            # Routing needs a centroid for every subject, so index any knowledge base not indexed yet.
+            for subject in self.available_subjects():
+                _, _, index_path = self.get_paths(subject)
+                if not MmapVectorStore.exists(index_path):
+                    store = self.load_or_create_vectorstore(subject)
+                    if store:
+                        store.close()
+            self.router = SubjectRouter(self.get_embeddings(), index_dir=self.data_dir / "VECTORSTORES")
+        return self.router
 
-        # Auto-reset memory if too long
-        if len(history.messages) > self.MAX_MESSAGES_PER_SESSION:
-            print(f"[INFO] Memory for session '{session_id}' exceeded {MAX_MESSAGES_PER_SESSION} messages. Resetting.")
-            history.clear()
+    def route(self, question: str, session_id: str = "default"):
+        """Subjects to query for `question`; follow-ups stay with the subjects of the previous question."""
+        previous = self.last_routes.get(session_id)
+        if previous and not is_standalone(question):
+            return previous
+        subjects = self.get_router().route(question)
+        if subjects:
+            self.last_routes[session_id] = subjects
+            print(f"[Router] '{question[:60]}' -> {', '.join(subjects)}")
+        return subjects
+
+    def combine_chains(self, subjects, chains):
+        """One chain answering from several subject chains, retrieving from all of their indexes."""
+        if len(chains) == 1:
+            return chains[0]
+        key = tuple(subjects)
+        cached = self.routed_chains.get(key)
+        if cached and all(a is b for a, b in zip(cached[0], chains)):
+            return cached[1]
+        first = chains[0]
+        combined = RAGChain(
+            llm=first.llm,
+            retriever=ShardedRetriever(retrievers=[chain.retriever for chain in chains], k=self.retrieval_k),
+            get_session_history=self.get_memory,
+            subject="+".join(subjects),
+            index_version=":".join(str(chain.index_version) for chain in chains),
+            answer_cache=first.answer_cache,
+            compressor=first.compressor,
+            table_index=first.table_index,  # Figures are looked up in the best matching subject only
+            parts=chains,
+        )
+        self.routed_chains[key] = (list(chains), combined)
+        return combined
+
+    def get_memory(self, session_id: str):
+        if session_id not in self.memory_store:
+            self.memory_store[session_id] = SummaryBufferHistory(self.get_llm(), max_tokens=self.memory_token_budget)
+        return self.memory_store[session_id]
 
-        return history
-    
     def setup_chain(self, subject: str):
         try:
             _, md_path, _ = self.get_paths(subject)
@@ -130,22 +300,22 @@ class RAGPipeline:
             vectorstore = self.load_or_create_vectorstore(subject)
             if not vectorstore:
                 return None
+            retriever = self.get_retriever(subject, vectorstore)
 
-            llm = OllamaLLM(model=self.rag_model, temperature=0)
+            llm = self.get_llm()
 
-            base_chain = ConversationalRetrievalChain.from_llm(
+            index_version = ChunkManifest(vectorstore.path / ChunkManifest.FILE_NAME).source_hash
+            # Not kept on self: chains are owned by the caller (IndexPool), so eviction can unmap them.
+            return RAGChain(
                 llm=llm,
-                retriever=vectorstore.as_retriever(search_kwargs={"k": 2}),
-                return_source_documents=False
-            )
-
-            self.qa_chain = RunnableWithMessageHistory(
-                base_chain,
+                retriever=retriever,
                 get_session_history=self.get_memory,
-                input_messages_key="question",
-                history_messages_key="chat_history"
+                subject=subject,
+                index_version=index_version,
+                answer_cache=self.get_answer_cache(),
+                compressor=self.get_compressor(),
+                table_index=TableIndex.open(vectorstore.path),
             )
-            return self.qa_chain
         except Exception as e:
             print(f"[QA Chain Error] {e}")
             return None
@@ -160,8 +330,20 @@ class RAGPipeline:
         except Exception as e:
             return f"Error: {e}"
 
+    def ask_stream(self, qa_chain, question: str, session_id: str = "default"):
+        """Like `ask`, but yields the answer token by token."""
+        if not qa_chain:
+            print("QA chain not initialized.")
+            yield "No QA chain available."
+            return
+        try:
+            yield from qa_chain.stream({"question": question}, config={"configurable": {"session_id": session_id}})
+        except Exception as e:
+            yield f"Error: {e}"
+
     def interactive_chat(self, subject: str):
-        if not self.setup_chain(subject):
+        self.qa_chain = self.setup_chain(subject)
+        if not self.qa_chain:
             print("Could not set up RAG chain.")
             return
         print("\nChat with the RAG model. Type 'exit' to quit.\n")
@@ -170,7 +352,10 @@ class RAGPipeline:
             if question.lower() in {"exit", "quit", "bye"}:
                 print("Goodbye!")
                 break
-            print("AI:", self.ask(self.qa_chain, question, session_id="default"))
+            print("AI:", end=" ")
+            for token in self.ask_stream(self.qa_chain, question, session_id="default"):
+                print(token, end="", flush=True)
+            print()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,78 @@
+import argparse
+import time
+from pathlib import Path
+
+import faiss
+import numpy as np
+
+from src.BRAIN.embedding_pipeline import EmbeddingPipeline, HashEmbedder
+from src.BRAIN.markdown_chunker import MarkdownChunker
+from src.BRAIN.mmap_store import INDEX_TYPES, build_ann_index, search_index, tune_index
+
+
+def load_corpus(md_path, embedder, n_queries: int):
+    text = Path(md_path).read_text(encoding="utf-8")
+    chunks = [d.page_content for d in MarkdownChunker().create_documents(text)]
+    pipeline = EmbeddingPipeline(embedder, progress=None)
+    vectors = np.asarray(pipeline.embed_documents(chunks), dtype=np.float32)
+    # Queries: sentences sampled across the document, embedded the same way as user questions.
+    sentences = [s for s in text.replace("\n", " ").split(". ") if len(s.split()) >= 6]
+    step = max(1, len(sentences) // n_queries)
+    queries = np.asarray([embedder.embed_query(s) for s in sentences[::step][:n_queries]], dtype=np.float32)
+    return vectors, queries
+
+
+def scale_corpus(vectors, factor: int, seed: int = 0):
+    """Tile the corpus `factor` times with small noise, to see how each index type scales."""
+    if factor <= 1:
+        return vectors
+    rng = np.random.default_rng(seed)
+    copies = [vectors] + [vectors + rng.normal(0, 0.01, vectors.shape).astype(np.float32) for _ in range(factor - 1)]
+    return np.ascontiguousarray(np.vstack(copies))
+
+
+def run(md_path, k: int = 10, n_queries: int = 200, scale: int = 1, use_ollama: bool = False):
+    if use_ollama:
+        from langchain_ollama import OllamaEmbeddings
+        from src.FUNCTION.Tools.get_env import EnvManager
+        embedder = OllamaEmbeddings(model=EnvManager.load_variable("Embedding_model"))
+    else:
+        embedder = HashEmbedder()
+    vectors, queries = load_corpus(md_path, embedder, n_queries)
+    vectors = scale_corpus(vectors, scale)
+    print(f"{Path(md_path).name}: {len(vectors)} vectors x {vectors.shape[1]} dims, {len(queries)} queries, k={k}")
+
+    _, truth = faiss.knn(queries, vectors, k)
+    for index_type in INDEX_TYPES:
+        start = time.perf_counter()
+        index = build_ann_index(vectors, index_type)
+        build_time = time.perf_counter() - start
+        tune_index(index)
+
+        start = time.perf_counter()
+        for query in queries:
+            search_index(index, vectors, query, k)
+        latency_ms = 1000 * (time.perf_counter() - start) / len(queries)
+
+        # Stores keep vectors.npy next to every index type (rebuilds reuse its vectors), and IVF-PQ re-ranks against it.
+        if index is None:
+            found, index_bytes = truth, 0
+        else:
+            _, found = search_index(index, vectors, queries, k)
+            index_bytes = faiss.serialize_index(index).nbytes
+        memory = index_bytes + vectors.nbytes
+        recall = np.mean([len(set(f) & set(t)) / k for f, t in zip(found, truth)])
+        print(f"  {index_type:6s} recall@{k}={recall:.3f}  latency={latency_ms:7.3f} ms/query  "
+              f"memory={memory / 2 ** 20:7.2f} MB (index {index_bytes / 2 ** 20:6.2f} MB + vectors "
+              f"{vectors.nbytes / 2 ** 20:6.2f} MB)  build={build_time:6.2f}s")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Recall@k vs latency vs memory of flat, HNSW and IVF-PQ indexes.")
+    parser.add_argument("--corpus", default="./DATA/KNOWLEDGEBASE/disaster_data_converted.md")
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--scale", type=int, default=1, help="tile the corpus N times to simulate a larger one")
+    parser.add_argument("--ollama", action="store_true", help="embed with the configured Ollama model")
+    args = parser.parse_args()
+    run(args.corpus, k=args.k, n_queries=args.queries, scale=args.scale, use_ollama=args.ollama)
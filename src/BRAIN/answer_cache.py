@@ -0,0 +1,75 @@
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+from src.BRAIN.lexical_index import BM25Index
+
+
+class SemanticAnswerCache:
+    """Per-subject cache of RAG answers, matched to new questions by embedding similarity.
+
+    Entries expire after `ttl` seconds, each subject keeps at most `max_entries`
+    (least recently used first out), and a subject's entries are dropped as soon
+    as they were produced against a different index version.
+
+    Questions that differ only in a name or a year embed almost identically, so a hit also
+    needs the same numbers and capitalized names (`BM25Index.named_terms`) in both questions.
+    """
+
+    def __init__(self, embedder, threshold: float = 0.9, ttl: float = 24 * 3600, max_entries: int = 256):
+        self.embedder = embedder
+        self.threshold = threshold
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._subjects = {}  # subject -> (index_version, OrderedDict[question -> (vector, answer, created, names)])
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _entries(self, subject: str, index_version: str) -> OrderedDict:
+        version, entries = self._subjects.get(subject, (None, None))
+        if entries is None or version != index_version:
+            entries = OrderedDict()
+            self._subjects[subject] = (index_version, entries)
+        return entries
+
+    def _embed(self, question: str):
+        vector = np.asarray(self.embedder.embed_query(question), dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def lookup(self, subject: str, index_version: str, question: str):
+        """Cached answer for a question similar enough to `question`, or None."""
+        vector = self._embed(question)
+        names = BM25Index.named_terms(question)
+        now = time.time()
+        with self._lock:
+            entries = self._entries(subject, index_version)
+            for key in [k for k, (_, _, created, _) in entries.items() if now - created > self.ttl]:
+                del entries[key]
+            keys = [k for k, (_, _, _, entry_names) in entries.items() if entry_names == names]
+            if keys:
+                matrix = np.stack([entries[k][0] for k in keys])
+                scores = matrix @ vector
+                best = int(np.argmax(scores))
+                if scores[best] >= self.threshold:
+                    entries.move_to_end(keys[best])
+                    self.hits += 1
+                    return entries[keys[best]][1]
+            self.misses += 1
+            return None
+
+    def store(self, subject: str, index_version: str, question: str, answer: str):
+        vector = self._embed(question)
+        with self._lock:
+            entries = self._entries(subject, index_version)
+            entries[question] = (vector, answer, time.time(), BM25Index.named_terms(question))
+            entries.move_to_end(question)
+            while len(entries) > self.max_entries:
+                entries.popitem(last=False)
+
+    def invalidate(self, subject: str):
+        with self._lock:
+            self._subjects.pop(subject, None)
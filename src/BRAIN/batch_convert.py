@@ -0,0 +1,221 @@
+import argparse
+import os
+import tempfile
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+
+from docling.datamodel.base_models import InputFormat
+from docling.datamodel.pipeline_options import PdfPipelineOptions
+from docling.document_converter import DocumentConverter, PdfFormatOption, WordFormatOption, SimplePipeline
+
+RAW_DIR = Path("./DATA/RAWKNOWLEDGEBASE")
+MARKDOWN_DIR = Path("./DATA/KNOWLEDGEBASE")
+PAGES_PER_PART = 25  # PDFs longer than this are split into page ranges converted in parallel
+MIN_TEXT_CHARS = 32  # A PDF page with fewer embedded characters is treated as scanned
+
+# Conversion paths, as counted in the report.
+TEXT_LAYER = "text_layer"  # PDF page with embedded text: OCR skipped
+OCR = "ocr"                # scanned PDF page
+DIRECT = "direct"          # DOCX/PPTX/HTML: text is read from the file itself, never OCR'd
+
+DOCUMENT_FORMATS = {
+    '.pdf': InputFormat.PDF,
+    '.docx': InputFormat.DOCX,
+    '.doc': InputFormat.DOCX,
+    '.pptx': InputFormat.PPTX,
+    '.html': InputFormat.HTML,
+    '.htm': InputFormat.HTML
+}
+
+# Converters load layout/OCR models when created, so each process builds one per
+# (format, OCR on/off) and keeps it.
+_converters = {}
+
+
+def get_document_format(file_path):
+    return DOCUMENT_FORMATS.get(Path(file_path).suffix.lower())
+
+
+def markdown_path_for(doc_path) -> Path:
+    """DATA/RAWKNOWLEDGEBASE/<name>.pdf -> DATA/KNOWLEDGEBASE/<name>_converted.md"""
+    return MARKDOWN_DIR / f"{Path(doc_path).stem}_converted.md"
+
+
+def get_converter(doc_format, do_ocr: bool = True) -> DocumentConverter:
+    key = (doc_format, do_ocr)
+    if key not in _converters:
+        pipeline_options = PdfPipelineOptions(do_ocr=do_ocr, do_table_structure=True)
+        _converters[key] = DocumentConverter(
+            allowed_formats=[doc_format],
+            format_options={
+                InputFormat.PDF: PdfFormatOption(pipeline_options=pipeline_options),
+                InputFormat.DOCX: WordFormatOption(pipeline_cls=SimplePipeline)
+            }
+        )
+    return _converters[key]
+
+
+def convert_part(file_path, do_ocr: bool = True):
+    """Convert one file (or PDF page range) with this process's cached converter.
+
+    Returns (markdown, page count docling reports; 0 for formats without pages such as HTML).
+    """
+    doc_format = get_document_format(file_path)
+    if not doc_format:
+        raise ValueError(f"Unsupported format: {Path(file_path).suffix}")
+    conv_result = get_converter(doc_format, do_ocr).convert(str(file_path))
+    if not conv_result or not conv_result.document:
+        raise RuntimeError(f"Conversion failed for: {file_path}")
+    return conv_result.document.export_to_markdown(), len(conv_result.document.pages)
+
+
+def detect_text_pages(pdf_path):
+    """One flag per page: True when the page carries an embedded text layer."""
+    import pypdfium2 as pdfium
+
+    pdf = pdfium.PdfDocument(str(pdf_path))
+    try:
+        flags = []
+        for index in range(len(pdf)):
+            page = pdf[index]
+            textpage = page.get_textpage()
+            flags.append(len(textpage.get_text_range().strip()) >= MIN_TEXT_CHARS)
+            textpage.close()
+            page.close()
+        return flags
+    finally:
+        pdf.close()
+
+
+def plan_parts(source, pages_per_part: int, out_dir):
+    """Split a document into [(file, page_count, path)] parts, in page order.
+
+    PDF pages are grouped into runs that share a conversion path, and runs longer than
+    `pages_per_part` are cut further. Parts other than the whole file are written to `out_dir`.
+    DOCX/PPTX/HTML are a single part with page_count None; docling reports their pages on conversion.
+    """
+    if get_document_format(source) != InputFormat.PDF:
+        return [(Path(source), None, DIRECT)]
+
+    flags = detect_text_pages(source)
+    ranges = []  # (start, end, path)
+    for index, has_text in enumerate(flags):
+        path = TEXT_LAYER if has_text else OCR
+        if ranges and ranges[-1][2] == path and index - ranges[-1][0] < pages_per_part:
+            ranges[-1] = (ranges[-1][0], index + 1, path)
+        else:
+            ranges.append((index, index + 1, path))
+
+    if len(ranges) <= 1:
+        return [(Path(source), len(flags), ranges[0][2] if ranges else TEXT_LAYER)]
+
+    from pypdf import PdfReader, PdfWriter
+
+    reader = PdfReader(str(source))
+    parts = []
+    for start, end, path in ranges:
+        writer = PdfWriter()
+        for page in reader.pages[start:end]:
+            writer.add_page(page)
+        part_path = Path(out_dir) / f"{Path(source).stem}_p{start + 1:05d}-{end:05d}.pdf"
+        with open(part_path, "wb") as f:
+            writer.write(f)
+        parts.append((part_path, end - start, path))
+    return parts
+
+
+def convert_to_markdown(file_path, pages_per_part: int = PAGES_PER_PART) -> str:
+    """Convert one document in this process, skipping OCR on pages that already have text."""
+    if not get_document_format(file_path):
+        raise ValueError(f"Unsupported format: {Path(file_path).suffix}")
+    with tempfile.TemporaryDirectory() as temp_dir:
+        parts = plan_parts(file_path, pages_per_part, temp_dir)
+        return "\n\n".join(convert_part(part, do_ocr=(path == OCR))[0] for part, _, path in parts)
+
+
+def _init_worker(threads_per_worker: int):
+    # Keep torch from starting one thread per core in every worker process.
+    try:
+        import torch
+        torch.set_num_threads(threads_per_worker)
+    except ImportError:
+        pass
+
+
+def convert_all(raw_dir=RAW_DIR, workers: int = None, pages_per_part: int = PAGES_PER_PART):
+    """Convert every supported document under `raw_dir` to markdown using a process pool."""
+    workers = workers or max(1, min(4, os.cpu_count() or 1))
+    sources = sorted(p for p in Path(raw_dir).iterdir() if p.is_file() and get_document_format(p))
+    if not sources:
+        print(f"No documents to convert in {raw_dir}")
+        return {}
+
+    start = time.perf_counter()
+    pages_by_path = Counter()
+    unpaged = 0  # Documents docling reports no pages for (HTML, usually DOCX); left out of pages/s
+    results = {}
+    with tempfile.TemporaryDirectory() as temp_dir:
+        jobs = {}  # source -> [(part, page_count, path)] in page order
+        for source in sources:
+            try:
+                jobs[source] = plan_parts(source, pages_per_part, temp_dir)
+            except Exception as e:
+                print(f"[Conversion Error] {source}: {e}")
+                results[source] = False
+                continue
+            for _, pages, path in jobs[source]:
+                if pages is not None:
+                    pages_by_path[path] += pages
+
+        threads = max(1, (os.cpu_count() or 1) // workers)
+        markdown_parts = {source: [None] * len(parts) for source, parts in jobs.items()}
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(threads,)) as executor:
+            futures = {}
+            for source, parts in jobs.items():
+                for index, (part, _, path) in enumerate(parts):
+                    futures[executor.submit(convert_part, str(part), path == OCR)] = (source, index)
+
+            for future in as_completed(futures):
+                source, index = futures[future]
+                try:
+                    markdown_parts[source][index], pages = future.result()
+                    _, planned, path = jobs[source][index]
+                    if planned is None:
+                        if pages:
+                            pages_by_path[path] += pages
+                        else:
+                            unpaged += 1
+                except Exception as e:
+                    print(f"[Conversion Error] {source} part {index + 1}: {e}")
+
+    for source, parts in markdown_parts.items():
+        if any(part is None for part in parts):
+            results[source] = False
+            continue
+        md_path = markdown_path_for(source)
+        md_path.parent.mkdir(parents=True, exist_ok=True)
+        with open(md_path, "w", encoding="utf-8") as f:
+            f.write("\n\n".join(parts))
+        results[source] = True
+        print(f"Converted {source} -> {md_path} ({len(parts)} part(s))")
+
+    elapsed = time.perf_counter() - start
+    total_pages = sum(pages_by_path.values())
+    rate = total_pages / elapsed if elapsed else 0.0
+    print(f"[Conversion] {total_pages} pages from {len(sources)} documents in {elapsed:.1f}s: "
+          f"{rate:.2f} pages/s, {rate / workers:.2f} pages/s per core ({workers} workers)")
+    print(f"[Conversion] Paths: {pages_by_path[TEXT_LAYER]} PDF pages with a text layer (no OCR), "
+          f"{pages_by_path[OCR]} scanned PDF pages (OCR), {pages_by_path[DIRECT]} DOCX/PPTX/HTML pages (direct)"
+          + (f"; {unpaged} documents without pages, not counted in pages/s" if unpaged else ""))
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Convert every document in DATA/RAWKNOWLEDGEBASE to markdown.")
+    parser.add_argument("--workers", type=int, default=None, help="worker processes (default: up to 4)")
+    parser.add_argument("--pages-per-part", type=int, default=PAGES_PER_PART,
+                        help="split PDFs longer than this into page ranges")
+    args = parser.parse_args()
+    convert_all(workers=args.workers, pages_per_part=args.pages_per_part)
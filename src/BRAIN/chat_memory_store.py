@@ -0,0 +1,197 @@
+import json
+import os
+import sqlite3
+import threading
+from pathlib import Path
+
+from src.BRAIN.near_duplicates import MinHashLSH
+
+
+class ChatMemoryStore:
+    """Important personal-chat exchanges in SQLite (WAL), safe for several processes at once.
+
+    Writes touch one row plus the evicted ones, whatever the history size: an upsert either
+    updates the matched exchange in place or appends a new one, and only the newest
+    `max_entries` exchanges are kept. Exchanges keep their insertion order, so a replaced
+    exchange is not moved to the end. An existing chat_history.json is imported once.
+
+    Each prompt's MinHash band keys and word keys are stored in `minhash`, so the duplicate check
+    in `upsert` only looks at prompts sharing a band, or one of the new prompt's rarest words,
+    instead of the whole history. Rare words catch a prompt contained in a longer one.
+    """
+
+    DB_PATH = "./DATA/chat_history.sqlite"
+    LEGACY_JSON_PATH = "./DATA/chat_history.json"
+    MAX_ENTRIES = 100
+    KEYS_VERSION = 1  # PRAGMA user_version once `minhash` holds word keys as well as band keys
+    RARE_WORDS = 3  # Words of a prompt looked up besides its bands
+    RARE_WORD_ROWS = 50  # Words in this many stored prompts or more are too common to look up
+
+    def __init__(self, path=DB_PATH, max_entries: int = MAX_ENTRIES, legacy_json=LEGACY_JSON_PATH, lsh=None):
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self.max_entries = max_entries
+        self.lsh = lsh or MinHashLSH()
+        self._lock = threading.Lock()
+        # Autocommit mode: transactions are opened explicitly with BEGIN IMMEDIATE.
+        self._conn = sqlite3.connect(str(path), check_same_thread=False, timeout=30, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS memories ("
+            " id INTEGER PRIMARY KEY AUTOINCREMENT, user TEXT NOT NULL, assistant TEXT NOT NULL, timestamp TEXT)"
+        )
+        self._conn.execute("CREATE TABLE IF NOT EXISTS minhash (key INTEGER NOT NULL, id INTEGER NOT NULL)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS minhash_key ON minhash (key)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS minhash_id ON minhash (id)")
+        self._upgrade_keys()
+        if legacy_json and Path(legacy_json).exists():
+            self._migrate(Path(legacy_json))
+        self._backfill()
+
+    def _migrate(self, json_path: Path):
+        with open(json_path, "r", encoding="utf-8") as f:
+            history = json.load(f)
+        rows = [(e["user"], e["assistant"], e.get("timestamp")) for e in history if "user" in e and "assistant" in e]
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                # Another process may have imported it between our exists() check and this lock.
+                if not self._conn.execute("SELECT 1 FROM memories LIMIT 1").fetchone():
+                    self._conn.executemany("INSERT INTO memories (user, assistant, timestamp) VALUES (?, ?, ?)", rows)
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+        try:
+            os.replace(json_path, json_path.with_name(json_path.name + ".migrated"))
+        except OSError:
+            pass
+        print(f"[Memory] Imported {len(rows)} exchanges from {json_path}")
+
+    def _upgrade_keys(self):
+        """Drop keys written before word keys existed; `_backfill` then indexes those prompts again."""
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                if self._conn.execute("PRAGMA user_version").fetchone()[0] < self.KEYS_VERSION:
+                    self._conn.execute("DELETE FROM minhash")
+                    self._conn.execute(f"PRAGMA user_version = {self.KEYS_VERSION}")
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def _backfill(self):
+        """Band keys for exchanges stored before near-duplicate lookup existed."""
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                rows = self._conn.execute(
+                    "SELECT id, user FROM memories WHERE id NOT IN (SELECT id FROM minhash)").fetchall()
+                for entry_id, user in rows:
+                    self._index_prompt(entry_id, user)
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def _index_prompt(self, entry_id: int, user: str):
+        keys = self.lsh.band_keys(user) + self.lsh.word_keys(user)
+        self._conn.executemany("INSERT INTO minhash VALUES (?, ?)", [(key, entry_id) for key in keys])
+
+    def _rare_word_keys(self, user: str):
+        """Keys of the prompt's least frequent words, skipping words in `RARE_WORD_ROWS` stored prompts or more."""
+        counts = []
+        for key in self.lsh.word_keys(user):
+            count = self._conn.execute(
+                "SELECT COUNT(*) FROM (SELECT 1 FROM minhash WHERE key = ? LIMIT ?)", (key, self.RARE_WORD_ROWS)
+            ).fetchone()[0]
+            if 0 < count < self.RARE_WORD_ROWS:
+                counts.append((count, key))
+        return [key for _, key in sorted(counts)[:self.RARE_WORDS]]
+
+    def _candidates(self, user: str):
+        keys = self.lsh.band_keys(user) + self._rare_word_keys(user)
+        placeholders = ",".join("?" * len(keys))
+        return self._conn.execute(
+            f"SELECT id, user FROM memories WHERE id IN (SELECT id FROM minhash WHERE key IN ({placeholders})) ORDER BY id",
+            keys,
+        )
+
+    def add_many(self, entries):
+        """Append exchanges without duplicate checks (imports and benchmarks); retention is not applied."""
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                for e in entries:
+                    cursor = self._conn.execute("INSERT INTO memories (user, assistant, timestamp) VALUES (?, ?, ?)",
+                                                (e["user"], e["assistant"], e.get("timestamp")))
+                    self._index_prompt(cursor.lastrowid, e["user"])
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    @staticmethod
+    def _entry(row):
+        entry_id, user, assistant, timestamp = row
+        return {"id": entry_id, "user": user, "assistant": assistant, "timestamp": timestamp}
+
+    def all(self):
+        """Every stored exchange, oldest first."""
+        with self._lock:
+            rows = self._conn.execute("SELECT id, user, assistant, timestamp FROM memories ORDER BY id").fetchall()
+        return [self._entry(row) for row in rows]
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM memories").fetchone()[0]
+
+    def upsert(self, user: str, assistant: str, timestamp: str, find_match=None):
+        """Replace the exchange `find_match` picks, or append a new one, then enforce retention.
+
+        `find_match(rows)` gets the (id, user) rows of the near-duplicate candidates, oldest first,
+        and returns the id to replace or None. It runs inside the write transaction, so concurrent
+        writers cannot both append the same exchange.
+        Returns (entry, replaced, evicted): the stored exchange, the exchange it replaced (or
+        None) and the exchanges dropped by retention.
+        """
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                match_id = find_match(self._candidates(user)) if find_match else None
+                replaced = None
+                if match_id is not None:
+                    row = self._conn.execute(
+                        "SELECT id, user, assistant, timestamp FROM memories WHERE id = ?", (match_id,)).fetchone()
+                    replaced = self._entry(row) if row else None
+                if replaced:
+                    self._conn.execute("UPDATE memories SET assistant = ?, timestamp = ? WHERE id = ?",
+                                       (assistant, timestamp, match_id))
+                    entry = {**replaced, "assistant": assistant, "timestamp": timestamp}
+                else:
+                    cursor = self._conn.execute("INSERT INTO memories (user, assistant, timestamp) VALUES (?, ?, ?)",
+                                                (user, assistant, timestamp))
+                    entry = {"id": cursor.lastrowid, "user": user, "assistant": assistant, "timestamp": timestamp}
+                    self._index_prompt(cursor.lastrowid, user)
+                # Rows are only ever deleted from the old end, so the newest `max_entries` exchanges are
+                # the last `max_entries` ids: a primary-key range, with no count or offset scan.
+                cutoff = self._conn.execute("SELECT MAX(id) FROM memories").fetchone()[0] - self.max_entries
+                evicted = [self._entry(row) for row in self._conn.execute(
+                    "SELECT id, user, assistant, timestamp FROM memories WHERE id <= ? ORDER BY id", (cutoff,))]
+                if evicted:
+                    self._conn.execute("DELETE FROM memories WHERE id <= ?", (cutoff,))
+                    self._conn.execute("DELETE FROM minhash WHERE id <= ?", (cutoff,))
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+        return entry, replaced, evicted
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM memories")
+            self._conn.execute("DELETE FROM minhash")
+
+    def close(self):
+        self._conn.close()
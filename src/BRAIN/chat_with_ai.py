@@ -1,17 +1,21 @@
 
-import json
-from pathlib import Path
 from langchain_ollama import ChatOllama
 from langchain_ollama import OllamaEmbeddings
-from langchain_community.vectorstores import FAISS
 from src.FUNCTION.Tools.get_env import EnvManager
+from src.BRAIN.chat_memory_store import ChatMemoryStore
+from src.BRAIN.embedding_cache import CachedEmbeddings
+from src.BRAIN.importance_classifier import ImportanceClassifier
+from src.BRAIN.memory_index import MemoryIndex
 import datetime
 import math
 from fuzzywuzzy import fuzz
 
 
 class PersonalChatAI:
-    HISTORY_FILE_PATH = "./DATA/chat_history.json"
+    HISTORY_FILE_PATH = "./DATA/chat_history.json"  # Legacy store, imported into HISTORY_DB_PATH once
+    HISTORY_DB_PATH = "./DATA/chat_history.sqlite"
+    MEMORY_INDEX_PATH = "./DATA/chat_memory_index"
+    IMPORTANCE_LOG_PATH = "./DATA/importance_decisions.sqlite"
     AI_MODEL = EnvManager.load_variable("Chat_model")
     EMBEDDING_MODEL = EnvManager.load_variable("Embedding_model")
     SCORE_THRESHOLD = 0.6  # Adjust this threshold as needed
@@ -19,19 +23,21 @@ class PersonalChatAI:
 
     def __init__(self):
         self.llm = ChatOllama(model=self.AI_MODEL, temperature=0)
+        self.embedding = CachedEmbeddings(OllamaEmbeddings(model=self.EMBEDDING_MODEL), self.EMBEDDING_MODEL)
+        self.memory_store = ChatMemoryStore(self.HISTORY_DB_PATH, self.MAX_HISTORY_SIZE, self.HISTORY_FILE_PATH)
+        self.memory_index = MemoryIndex(self.embedding, self.MEMORY_INDEX_PATH)
+        self.importance = ImportanceClassifier(self.IMPORTANCE_LOG_PATH)
 
     def get_current_timestamp(self):
         return datetime.datetime.now().isoformat()
 
     def load_chat_history(self):
-        if Path(self.HISTORY_FILE_PATH).exists():
-            with open(self.HISTORY_FILE_PATH, "r", encoding="utf-8") as file:
-                return json.load(file)
-        return []
+        return self.memory_store.all()
 
-    def save_chat_history(self, history):
-        with open(self.HISTORY_FILE_PATH, "w", encoding="utf-8") as file:
-            json.dump(history, file, indent=4)
+    @staticmethod
+    def memory_text(entry):
+        """Text a stored exchange is embedded and searched by."""
+        return entry["user"] + " " + entry["assistant"]
 
     def ask_ai_importance(self, prompt: str) -> bool:
         """Ask AI if the chat message is important."""
@@ -69,28 +75,26 @@ class PersonalChatAI:
         return "yes" in response.content.strip().lower()
 
     def store_important_chat(self, prompt: str, response: str, threshold=80):
-        """Store chat in history if AI deems it important."""
-        if self.ask_ai_importance(prompt):
+        """Store chat in history if it is deemed important (locally, or by the AI when unsure)."""
+        if self.importance.is_important(prompt, self.ask_ai_importance):
             cur_date_time = self.get_current_timestamp()
-            history = self.load_chat_history()
-            for entry in history:
-                if "user" in entry:
+
+            def find_match(rows):
+                for entry_id, user in rows:
                     similarity_score = max(
-                        fuzz.token_sort_ratio(prompt, entry["user"]),
-                        fuzz.token_set_ratio(prompt, entry["user"])
+                        fuzz.token_sort_ratio(prompt, user),
+                        fuzz.token_set_ratio(prompt, user)
                     )
-
                     if similarity_score >= threshold:
-                        entry["assistant"] = response
-                        entry["timestamp"] = cur_date_time
-                        break
-            else:
-                history.append({"user": prompt, "assistant": response, "timestamp": cur_date_time})
-
-            if len(history) > self.MAX_HISTORY_SIZE:
-                history.pop(0)
+                        return entry_id
+                return None
 
-            self.save_chat_history(history)
+            entry, replaced, evicted = self.memory_store.upsert(prompt, response, cur_date_time, find_match)
+            # Only the new or changed exchange is embedded; searches no longer re-embed the history.
+            self.memory_index.update(
+                added=[self.memory_text(entry)],
+                removed=[self.memory_text(e) for e in ([replaced] if replaced else []) + evicted],
+            )
 
     def distance_to_similarity_inverted(self, distance, scale=1.0):
         """Sigmoid-based similarity mapping with inverted distance."""
@@ -101,24 +105,19 @@ class PersonalChatAI:
         if not history:
             return []
 
-        embedding = OllamaEmbeddings(model=self.EMBEDDING_MODEL)
-
         combined_map = {
-            item["user"] + " " + item["assistant"]: item
+            MemoryIndex.key_for(self.memory_text(item)): item
             for item in history if "user" in item and "assistant" in item
         }
+        # A no-op unless the history file was changed by something other than store_important_chat.
+        self.memory_index.sync(self.memory_text(item) for item in combined_map.values())
 
-        vectorstore = FAISS.from_texts(
-            texts=list(combined_map.keys()),
-            embedding=embedding,
-        )
-
-        results_with_scores = vectorstore.similarity_search_with_score(query, k=7)
+        results_with_scores = self.memory_index.search(query, k=7)
         filtered_results = []
-        for result, score in results_with_scores:
+        for key, score in results_with_scores:
             similarity_score = self.distance_to_similarity_inverted(score)
-            if similarity_score >= self.SCORE_THRESHOLD:
-                filtered_results.append(combined_map[result.page_content])
+            if similarity_score >= self.SCORE_THRESHOLD and key in combined_map:
+                filtered_results.append(combined_map[key])
         return filtered_results
 
     def message_management(self, query):
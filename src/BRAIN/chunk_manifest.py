@@ -0,0 +1,73 @@
+import hashlib
+import json
+from pathlib import Path
+
+
+class ChunkManifest:
+    """Records which chunks a vectorstore holds, keyed by the hash of their content."""
+
+    FILE_NAME = "manifest.json"
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self.source_hash = None
+        self.chunker = None  # Chunking settings the chunks were produced with
+        self.embedding = None  # Embedding model the vectors were produced with
+        self.chunk_hashes = set()
+        self.load()
+
+    @staticmethod
+    def hash_text(text: str) -> str:
+        return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+    @staticmethod
+    def hash_bytes(data: bytes) -> str:
+        return hashlib.sha256(data).hexdigest()
+
+    @staticmethod
+    def hash_file(path) -> str:
+        digest = hashlib.sha256()
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                digest.update(block)
+        return digest.hexdigest()
+
+    def load(self):
+        if not self.path.exists():
+            return
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            self.source_hash = data.get("source_hash")
+            self.chunker = data.get("chunker")
+            self.embedding = data.get("embedding")
+            self.chunk_hashes = set(data.get("chunks", []))
+        except (OSError, ValueError) as e:
+            print(f"[Manifest Error] {e}")
+            self.source_hash = None
+            self.chunk_hashes = set()
+
+    def save(self, directory=None):
+        """Write the manifest to its path, or under `directory` when given."""
+        path = Path(directory) / self.FILE_NAME if directory else self.path
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump({"source_hash": self.source_hash, "chunker": self.chunker, "embedding": self.embedding,
+                       "chunks": sorted(self.chunk_hashes)}, f)
+
+    def diff(self, new_hashes):
+        """Split new chunk hashes into (reused, added) and list the stored hashes that were removed."""
+        new_hashes = set(new_hashes)
+        reused = new_hashes & self.chunk_hashes
+        added = new_hashes - self.chunk_hashes
+        removed = self.chunk_hashes - new_hashes
+        return sorted(reused), sorted(added), sorted(removed)
+
+    def is_current(self, source_hash: str, chunker: str, embedding: str) -> bool:
+        return self.source_hash == source_hash and self.chunker == chunker and self.embedding == embedding
+
+    def update(self, source_hash: str, chunk_hashes, chunker: str = None, embedding: str = None):
+        self.source_hash = source_hash
+        self.chunker = chunker
+        self.embedding = embedding
+        self.chunk_hashes = set(chunk_hashes)
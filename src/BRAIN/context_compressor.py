@@ -0,0 +1,78 @@
+import re
+
+import numpy as np
+
+from src.BRAIN.summary_memory import estimate_tokens
+
+
+class ContextCompressor:
+    """Trims retrieved chunks to the sentences most similar to the question, within a token budget.
+
+    Sentences are scored by cosine similarity in one matrix product. With CachedEmbeddings the
+    question vector is the one retrieval already computed and repeated chunks cost no new
+    embedding calls. Tables are kept or dropped as a whole, and kept units stay in document order.
+    """
+
+    BLOCK_SEPARATOR = re.compile(r"\n[ \t]*\n")
+    SENTENCE_END = re.compile(r"(?<=[.!?])\s+")
+
+    def __init__(self, embedder, token_budget: int = 400):
+        self.embedder = embedder
+        self.token_budget = token_budget
+        self.last_stats = None
+
+    def units(self, text: str):
+        """Split a chunk into tables and sentences."""
+        result = []
+        for block in self.BLOCK_SEPARATOR.split(text):
+            block = block.strip()
+            if not block:
+                continue
+            if block.lstrip().startswith("|"):
+                result.append(block)
+            else:
+                result.extend(s.strip() for s in self.SENTENCE_END.split(block) if s.strip())
+        return result
+
+    @staticmethod
+    def join_units(parts) -> str:
+        """Sentences run on with spaces; tables keep blank lines around them so they stay markdown tables."""
+        text = ""
+        for i, part in enumerate(parts):
+            if i:
+                table = part.startswith("|") or parts[i - 1].startswith("|")
+                text += "\n\n" if table else " "
+            text += part
+        return text
+
+    def compress(self, question: str, docs) -> str:
+        """Return the context string for `docs`, compressed when it exceeds the token budget."""
+        full = "\n\n".join(doc.page_content for doc in docs)
+        before = estimate_tokens(full)
+        if before <= self.token_budget:
+            self.last_stats = {"before": before, "after": before, "saved": 0}
+            return full
+
+        units = [(d, unit) for d, doc in enumerate(docs) for unit in self.units(doc.page_content)]
+        vectors = np.asarray(self.embedder.embed_documents([unit for _, unit in units]), dtype=np.float32)
+        query = np.asarray(self.embedder.embed_query(question), dtype=np.float32)
+        vectors /= np.linalg.norm(vectors, axis=1, keepdims=True) + 1e-12
+        scores = vectors @ (query / (np.linalg.norm(query) + 1e-12))
+
+        kept, used = [], 0
+        for i in np.argsort(-scores):
+            cost = estimate_tokens(units[i][1])
+            if used + cost > self.token_budget and kept:
+                continue
+            kept.append(int(i))
+            used += cost
+
+        by_doc = {}
+        for i in sorted(kept):
+            by_doc.setdefault(units[i][0], []).append(units[i][1])
+        context = "\n\n".join(self.join_units(parts) for parts in by_doc.values())
+
+        after = estimate_tokens(context)
+        self.last_stats = {"before": before, "after": after, "saved": before - after}
+        print(f"[RAG] Context compressed: {before} -> {after} tokens ({before - after} saved)")
+        return context
@@ -0,0 +1,132 @@
+import hashlib
+import sqlite3
+import threading
+import time
+from array import array
+from pathlib import Path
+
+from langchain_core.embeddings import Embeddings
+
+
+class EmbeddingCache:
+    """On-disk embedding store keyed by (model, text hash) with least-recently-used eviction."""
+
+    DB_PATH = "./DATA/embedding_cache.sqlite"
+    MAX_ENTRIES = 500_000
+
+    def __init__(self, path: str = DB_PATH, max_entries: int = MAX_ENTRIES):
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            " model TEXT NOT NULL, text_hash TEXT NOT NULL, vector BLOB NOT NULL, last_used REAL NOT NULL,"
+            " PRIMARY KEY (model, text_hash))"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS embeddings_last_used ON embeddings (last_used)")
+        self._conn.commit()
+        self._count = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+
+    @staticmethod
+    def hash_text(text: str) -> str:
+        return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+    def get_many(self, model: str, text_hashes) -> dict:
+        """Cached vectors for the given hashes; marks them as recently used."""
+        found = {}
+        text_hashes = list(dict.fromkeys(text_hashes))
+        with self._lock:
+            # Stay well below SQLite's bound-parameter limit.
+            for i in range(0, len(text_hashes), 500):
+                batch = text_hashes[i:i + 500]
+                placeholders = ",".join("?" * len(batch))
+                rows = self._conn.execute(
+                    f"SELECT text_hash, vector FROM embeddings WHERE model = ? AND text_hash IN ({placeholders})",
+                    [model, *batch],
+                )
+                for text_hash, blob in rows:
+                    vector = array("f")
+                    vector.frombytes(blob)
+                    found[text_hash] = vector.tolist()
+            if found:
+                now = time.time()
+                self._conn.executemany(
+                    "UPDATE embeddings SET last_used = ? WHERE model = ? AND text_hash = ?",
+                    [(now, model, text_hash) for text_hash in found],
+                )
+                self._conn.commit()
+        return found
+
+    def put_many(self, model: str, items):
+        """Store (text_hash, vector) pairs."""
+        now = time.time()
+        rows = [(model, text_hash, array("f", vector).tobytes(), now) for text_hash, vector in items]
+        if not rows:
+            return
+        with self._lock:
+            before = self._conn.total_changes
+            self._conn.executemany("INSERT OR IGNORE INTO embeddings VALUES (?, ?, ?, ?)", rows)
+            self._count += self._conn.total_changes - before
+            if self._count > self.max_entries:
+                self._evict(self._count - self.max_entries)
+            self._conn.commit()
+
+    def _evict(self, count: int):
+        self._conn.execute(
+            "DELETE FROM embeddings WHERE rowid IN (SELECT rowid FROM embeddings ORDER BY last_used LIMIT ?)",
+            (count,),
+        )
+        self._count = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+
+    def __len__(self):
+        return self._count
+
+
+_shared_cache = None
+_shared_cache_lock = threading.Lock()
+
+
+def get_shared_cache() -> EmbeddingCache:
+    """Process-wide cache, so RAG and personal chat share one connection."""
+    global _shared_cache
+    with _shared_cache_lock:
+        if _shared_cache is None:
+            _shared_cache = EmbeddingCache()
+        return _shared_cache
+
+
+class CachedEmbeddings(Embeddings):
+    """Wraps an embedder so that only texts missing from the cache reach it."""
+
+    def __init__(self, embedder: Embeddings, model_name: str, cache: EmbeddingCache = None):
+        self.embedder = embedder
+        self.model_name = model_name
+        self.cache = cache if cache is not None else get_shared_cache()
+        self.hits = 0
+        self.misses = 0
+
+    def _embed(self, namespace: str, texts, embed_fn):
+        hashes = [EmbeddingCache.hash_text(text) for text in texts]
+        found = self.cache.get_many(namespace, hashes)
+        missing = {}
+        for text_hash, text in zip(hashes, texts):
+            if text_hash not in found:
+                missing.setdefault(text_hash, text)
+        if missing:
+            vectors = embed_fn(list(missing.values()))
+            new_items = list(zip(missing, vectors))
+            self.cache.put_many(namespace, new_items)
+            found.update(new_items)
+        self.hits += len(texts) - len(missing)
+        self.misses += len(missing)
+        return [found[text_hash] for text_hash in hashes]
+
+    def embed_documents(self, texts):
+        return self._embed(self.model_name, list(texts), self.embedder.embed_documents)
+
+    def embed_query(self, text: str):
+        # Some models embed queries differently from documents, so they get their own key space.
+        return self._embed(f"{self.model_name}:query", [text], lambda t: [self.embedder.embed_query(t[0])])[0]
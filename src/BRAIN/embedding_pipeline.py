@@ -0,0 +1,117 @@
+import hashlib
+import math
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from langchain_core.embeddings import Embeddings
+
+
+class HashEmbedder(Embeddings):
+    """Deterministic offline embedder that hashes word tokens into a normalized vector.
+
+    Texts sharing words get similar vectors, so it is good enough to benchmark
+    ingestion and retrieval without an Ollama server. `delay` simulates the
+    per-call latency of a real embedding backend.
+    """
+
+    TOKEN_PATTERN = re.compile(r"\w+")
+
+    def __init__(self, dim: int = 256, delay: float = 0.0):
+        self.dim = dim
+        self.delay = delay
+
+    def _embed(self, text: str):
+        vector = [0.0] * self.dim
+        for token in self.TOKEN_PATTERN.findall(text.lower()):
+            digest = hashlib.md5(token.encode("utf-8")).digest()
+            bucket = int.from_bytes(digest[:4], "little") % self.dim
+            vector[bucket] += 1.0 if digest[4] & 1 else -1.0
+        norm = math.sqrt(sum(v * v for v in vector)) or 1.0
+        return [v / norm for v in vector]
+
+    def embed_documents(self, texts):
+        if self.delay:
+            time.sleep(self.delay)
+        return [self._embed(text) for text in texts]
+
+    def embed_query(self, text: str):
+        if self.delay:
+            time.sleep(self.delay)
+        return self._embed(text)
+
+
+def print_progress(done: int, total: int):
+    print(f"[Embedding] {done}/{total} chunks ({100 * done / total:.0f}%)")
+
+
+class EmbeddingPipeline:
+    """Embeds texts in fixed-size batches on a bounded worker pool, retrying failed batches."""
+
+    def __init__(self, embedder: Embeddings, batch_size: int = 32, max_workers: int = 4,
+                 max_retries: int = 3, retry_delay: float = 1.0, progress=print_progress):
+        self.embedder = embedder
+        self.batch_size = max(1, batch_size)
+        self.max_workers = max(1, max_workers)
+        self.max_retries = max_retries
+        self.retry_delay = retry_delay
+        self.progress = progress
+
+    def _embed_batch(self, batch):
+        for attempt in range(self.max_retries + 1):
+            try:
+                vectors = self.embedder.embed_documents(batch)
+                if len(vectors) != len(batch):
+                    raise ValueError(f"expected {len(batch)} embeddings, got {len(vectors)}")
+                return vectors
+            except Exception as e:
+                if attempt == self.max_retries:
+                    raise
+                print(f"[Embedding] Batch failed ({e}), retry {attempt + 1}/{self.max_retries}")
+                time.sleep(self.retry_delay * (2 ** attempt))
+
+    def embed_documents(self, texts):
+        """Embed `texts`, returning vectors in input order."""
+        texts = list(texts)
+        if not texts:
+            return []
+        batches = [texts[i:i + self.batch_size] for i in range(0, len(texts), self.batch_size)]
+        results = [None] * len(batches)
+        done = 0
+        # Report roughly every 10% so multi-MB subjects don't flood the console.
+        report_every = max(1, len(texts) // 10)
+        next_report = report_every
+
+        with ThreadPoolExecutor(max_workers=min(self.max_workers, len(batches))) as executor:
+            futures = {executor.submit(self._embed_batch, batch): i for i, batch in enumerate(batches)}
+            for future in as_completed(futures):
+                index = futures[future]
+                results[index] = future.result()
+                done += len(batches[index])
+                if self.progress and (done >= next_report or done == len(texts)):
+                    self.progress(done, len(texts))
+                    next_report = done + report_every
+
+        return [vector for batch in results for vector in batch]
+
+
+if __name__ == "__main__":
+    # Offline benchmark: serial single call vs. the batched pool, with a simulated per-call latency.
+    from pathlib import Path
+    from langchain.text_splitter import RecursiveCharacterTextSplitter
+
+    text = Path("./DATA/KNOWLEDGEBASE/disaster_data_converted.md").read_text(encoding="utf-8")
+    chunks = RecursiveCharacterTextSplitter(chunk_size=500, chunk_overlap=100).split_text(text)
+    stub = HashEmbedder(delay=0.02)
+    print(f"{len(chunks)} chunks")
+
+    start = time.perf_counter()
+    for i in range(0, len(chunks), 32):
+        stub.embed_documents(chunks[i:i + 32])
+    print(f"Serial batches: {time.perf_counter() - start:.2f}s")
+
+    for workers in (2, 4, 8):
+        pipeline = EmbeddingPipeline(stub, batch_size=32, max_workers=workers, progress=None)
+        start = time.perf_counter()
+        pipeline.embed_documents(chunks)
+        print(f"Pipeline, {workers} workers: {time.perf_counter() - start:.2f}s")
@@ -0,0 +1,163 @@
+import argparse
+import random
+import re
+import sqlite3
+import threading
+import time
+import zlib
+from pathlib import Path
+
+import numpy as np
+
+TOKEN = re.compile(r"[a-z0-9']+")
+# (feature, pattern, prior weight): personal facts and feelings are worth remembering, requests are not.
+RULES = [
+    ("self_fact", re.compile(
+        r"\b(my name is|call me|i live|i'?m from|i am from|i grew up|i work|i'?m an? |i am an? |i study|"
+        r"my (wife|husband|partner|girlfriend|boyfriend|son|daughter|kids?|mom|mother|dad|father|sister|brother|"
+        r"family|friend|dog|cat|pet|job|boss|birthday|favou?rite)|i (love|like|hate|prefer|enjoy|can'?t stand)|"
+        r"birthday|allergic|anniversary|i'?m (married|single|vegetarian|vegan))\b"), 2.5),
+    ("feeling", re.compile(
+        r"\b(i (feel|felt)|i'?m feeling|i am feeling|i'?ve been feeling|anxious|depressed|lonely|stressed|"
+        r"worried|scared|sad|upset|heartbroken|overwhelmed|excited|proud|grateful)\b"), 2.0),
+    ("request", re.compile(
+        r"^(please )?(can|could|would|will) you\b|\b(help me|how (do|to|can|does)|what is|what'?s the|explain|"
+        r"write|calculate|solve|translate|summari[sz]e|search|open|play|tell me (a|about)|define)\b"), -2.0),
+    ("question", re.compile(r"\?\s*$"), -0.5),
+    ("short", re.compile(r"^\W*(\w+\W+){0,2}\w*\W*$"), -1.0),
+    ("first_person", re.compile(r"\b(i|i'm|i've|my|me|mine|myself)\b"), 0.5),
+]
+HASH_DIM = 2 ** 12
+FEATURES = len(RULES) + HASH_DIM + 1  # Rules, hashed words and word pairs, bias
+PRIOR_BIAS = -0.5
+
+
+def sigmoid(x):
+    return 1 / (1 + np.exp(-x))
+
+
+class ImportanceClassifier:
+    """Decides locally whether a chat message is worth remembering, asking the LLM only when unsure.
+
+    A logistic model over rule features and hashed words, kept sparse: a prompt sets a few dozen
+    of the 4103 features, so scoring and fitting cost scales with the words present rather than
+    with the hash size. It starts from hand-set weights on
+    the rules and is refit on the LLM's logged decisions, regularized toward those weights so a
+    handful of examples cannot undo them. Messages scoring between `low` and `high` go to the
+    LLM; `audit_rate` of the confident ones do too, so agreement with the LLM can be measured.
+    Every decision is logged to SQLite, which is also what `stats()` reports from.
+    """
+
+    DB_PATH = "./DATA/importance_decisions.sqlite"
+
+    def __init__(self, path=DB_PATH, low: float = 0.15, high: float = 0.85, audit_rate: float = 0.05,
+                 l2: float = 0.05):
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self.low = low
+        self.high = high
+        self.audit_rate = audit_rate
+        self.l2 = l2  # Pull toward the rule weights; keeps a few examples from overriding them
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(path), check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS decisions ("
+            " prompt TEXT NOT NULL, probability REAL NOT NULL, local INTEGER, llm INTEGER, created REAL NOT NULL)"
+        )
+        self._conn.commit()
+        self.prior = np.zeros(FEATURES, dtype=np.float64)
+        self.prior[:len(RULES)] = [weight for _, _, weight in RULES]
+        self.prior[-1] = PRIOR_BIAS
+        self.weights = self.prior.copy()
+        self.fit()
+
+    @staticmethod
+    def features(prompt: str):
+        """(indices, values) of the non-zero features of `prompt`."""
+        text = prompt.lower().strip()
+        rules = {}
+        for i, (name, pattern, _) in enumerate(RULES):
+            value = min(len(pattern.findall(text)), 3) if name == "first_person" else float(bool(pattern.search(text)))
+            if value:
+                rules[i] = value
+        tokens = TOKEN.findall(text)
+        grams = {len(RULES) + zlib.crc32(gram.encode("utf-8")) % HASH_DIM
+                 for gram in tokens + [f"{a} {b}" for a, b in zip(tokens, tokens[1:])]}
+        indices = np.array([*rules, *sorted(grams), FEATURES - 1], dtype=np.int64)
+        values = np.array([*rules.values(), *[1.0] * len(grams), 1.0], dtype=np.float64)
+        return indices, values
+
+    def probability(self, prompt: str) -> float:
+        indices, values = self.features(prompt)
+        return float(sigmoid(values @ self.weights[indices]))
+
+    def fit(self, iterations: int = 300, learning_rate: float = 0.5, max_examples: int = 5000):
+        """Refit on the latest logged LLM decisions (full-batch gradient descent on the sparse features)."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT prompt, llm FROM decisions WHERE llm IS NOT NULL ORDER BY rowid DESC LIMIT ?", (max_examples,)
+            ).fetchall()
+        if not rows:
+            return
+        features = [self.features(prompt) for prompt, _ in rows]
+        # One entry per non-zero feature: the example it belongs to, its index and its value.
+        example = np.repeat(np.arange(len(rows)), [len(indices) for indices, _ in features])
+        indices = np.concatenate([indices for indices, _ in features])
+        values = np.concatenate([values for _, values in features])
+        y = np.array([label for _, label in rows], dtype=np.float64)
+        weights = self.prior.copy()
+        for _ in range(iterations):
+            scores = np.bincount(example, weights=values * weights[indices], minlength=len(rows))
+            error = sigmoid(scores) - y
+            gradient = np.bincount(indices, weights=values * error[example], minlength=FEATURES) / len(y)
+            weights -= learning_rate * (gradient + self.l2 * (weights - self.prior))
+        self.weights = weights
+
+    def _log(self, prompt: str, probability: float, local, llm):
+        with self._lock:
+            self._conn.execute("INSERT INTO decisions VALUES (?, ?, ?, ?, ?)", (prompt, probability, local, llm, time.time()))
+            self._conn.commit()
+
+    def is_important(self, prompt: str, ask_llm) -> bool:
+        """Local decision when confident, else (and for audits) `ask_llm(prompt)`."""
+        probability = self.probability(prompt)
+        confident = probability <= self.low or probability >= self.high
+        local = probability >= self.high if confident else None
+        if confident and random.random() >= self.audit_rate:
+            self._log(prompt, probability, int(local), None)
+            return local
+        llm = bool(ask_llm(prompt))
+        self._log(prompt, probability, None if local is None else int(local), int(llm))
+        # One gradient step on the new example; fit() redoes it properly on the next start.
+        indices, values = self.features(prompt)
+        gradient = self.l2 * (self.weights - self.prior)
+        gradient[indices] += values * (sigmoid(values @ self.weights[indices]) - llm)
+        self.weights -= 0.5 * gradient
+        return llm
+
+    def stats(self) -> dict:
+        with self._lock:
+            total, llm_calls, audited, agreed = self._conn.execute(
+                "SELECT COUNT(*), COUNT(llm), COUNT(CASE WHEN local IS NOT NULL AND llm IS NOT NULL THEN 1 END),"
+                " COUNT(CASE WHEN local IS NOT NULL AND llm = local THEN 1 END) FROM decisions"
+            ).fetchone()
+        return {
+            "decisions": total,
+            "llm_calls": llm_calls,
+            "avoided": 1 - llm_calls / total if total else 0.0,
+            "audited": audited,
+            "agreement": agreed / audited if audited else None,
+        }
+
+    def close(self):
+        self._conn.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="How often the local importance classifier skipped the LLM.")
+    parser.add_argument("--db", default=ImportanceClassifier.DB_PATH)
+    args = parser.parse_args()
+    stats = ImportanceClassifier(args.db).stats()
+    agreement = "n/a" if stats["agreement"] is None else f"{stats['agreement']:.1%}"
+    print(f"{stats['decisions']} decisions, {stats['llm_calls']} LLM calls ({stats['avoided']:.1%} avoided), "
+          f"agreement with the LLM on {stats['audited']} audited local decisions: {agreement}")
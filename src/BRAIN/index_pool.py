@@ -0,0 +1,142 @@
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+
+
+class IndexPool:
+    """Lazily loaded subject chains, evicted least-recently-used first when over a memory budget.
+
+    With `version_of`, a subject whose index version on disk changed since it was loaded
+    (e.g. rebuilt by the ingestion daemon) is reloaded on its next request.
+
+    A chain from `get` can be evicted and closed by the next load, from this or another
+    session. Callers that use it afterwards take it through `lease`, which pins it while the
+    pool lock is held, so its indexes stay mapped until the lease ends.
+    """
+
+    def __init__(self, loader, memory_budget_mb: int = 1024, version_of=None):
+        self.loader = loader  # subject -> chain (or None when the subject cannot be loaded)
+        self.version_of = version_of  # subject -> version token of its index on disk
+        self.memory_budget = memory_budget_mb * 2 ** 20
+        self._entries = OrderedDict()  # subject -> (chain, bytes, version)
+        self._lock = threading.Lock()
+        self._load_locks = {}
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.reloads = 0
+
+    @staticmethod
+    def size_of(chain) -> int:
+        footprint = getattr(chain, "memory_footprint", None)
+        return footprint() if footprint else 0
+
+    def _lookup(self, subject: str, version):
+        """Cached chain for `subject` if it is still the version on disk. Call with the pool lock held."""
+        entry = self._entries.get(subject)
+        if entry is None:
+            return None
+        if entry[2] != version:
+            del self._entries[subject]
+            self._close(entry[0])
+            self.reloads += 1
+            print(f"[Index Pool] '{subject}' changed on disk, reloading")
+            return None
+        self._entries.move_to_end(subject)
+        self.hits += 1
+        return entry[0]
+
+    def current_version(self, subject: str):
+        return self.version_of(subject) if self.version_of else None
+
+    def get(self, subject: str):
+        return self._get(subject)
+
+    @contextmanager
+    def lease(self, subjects):
+        """Chains for `subjects` (None where one cannot be loaded), kept usable until the block exits."""
+        keep = set(subjects)
+        chains = []
+        try:
+            for subject in subjects:
+                chains.append(self._get(subject, pin=True, keep=keep))
+            yield chains
+        finally:
+            for chain in chains:
+                if chain is not None:
+                    chain.unpin()
+
+    def _get(self, subject: str, pin: bool = False, keep=()):
+        """With `pin`, the chain is pinned before the pool lock is released; this load never evicts `keep`."""
+        version = self.current_version(subject)
+        with self._lock:
+            chain = self._lookup(subject, version)
+            if chain is not None:
+                if pin:
+                    chain.pin()
+                return chain
+            load_lock = self._load_locks.setdefault(subject, threading.Lock())
+
+        # Load outside the pool lock so one slow subject does not block the others.
+        with load_lock:
+            version = self.current_version(subject)  # Another thread may have loaded a newer build meanwhile
+            with self._lock:
+                chain = self._lookup(subject, version)
+                if chain is not None:
+                    if pin:
+                        chain.pin()
+                    return chain
+                self.misses += 1
+            chain = self.loader(subject)
+            if chain is None:
+                return None
+            size = self.size_of(chain)
+            version = self.current_version(subject)  # Loading may itself have built a new version
+            with self._lock:
+                self._entries[subject] = (chain, size, version)
+                if pin:
+                    chain.pin()
+                self._evict(keep={subject, *keep})
+            print(f"[Index Pool] Loaded '{subject}' ({size / 2 ** 20:.1f} MB, "
+                  f"{self.resident_bytes() / 2 ** 20:.1f} MB resident)")
+            return chain
+
+    def _evict(self, keep=()):
+        # The subjects of the current request always stay, even if they alone exceed the budget.
+        for subject in list(self._entries):
+            if sum(entry[1] for entry in self._entries.values()) <= self.memory_budget:
+                break
+            if subject in keep:
+                continue
+            chain = self._entries.pop(subject)[0]
+            self._close(chain)
+            self.evictions += 1
+            print(f"[Index Pool] Evicted '{subject}'")
+
+    @staticmethod
+    def _close(chain):
+        # Questions still running on the chain finish first (see RAGChain.close).
+        close = getattr(chain, "close", None)
+        if close:
+            close()
+
+    def invalidate(self, subject: str):
+        with self._lock:
+            entry = self._entries.pop(subject, None)
+        if entry:
+            self._close(entry[0])
+
+    def resident_bytes(self) -> int:
+        with self._lock:
+            return sum(entry[1] for entry in self._entries.values())
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "reloads": self.reloads,
+                "subjects": list(self._entries),
+                "resident_mb": sum(entry[1] for entry in self._entries.values()) / 2 ** 20,
+            }
@@ -0,0 +1,157 @@
+import argparse
+import os
+import time
+from pathlib import Path
+
+from src.BRAIN.batch_convert import MARKDOWN_DIR, RAW_DIR, convert_to_markdown, get_document_format, markdown_path_for
+from src.BRAIN.mmap_store import MmapVectorStore
+
+MARKDOWN_SUFFIX = "_data_converted.md"  # Knowledge bases the RAG pipeline serves: <subject>_data_converted.md
+
+
+class IngestionDaemon:
+    """Converts and indexes knowledge-base files as they appear, before anyone asks about them.
+
+    New or changed documents in DATA/RAWKNOWLEDGEBASE are converted to markdown, and new or
+    changed markdown in DATA/KNOWLEDGEBASE is chunked and indexed. Indexes are written as new
+    versions and swapped in atomically (see MmapVectorStore.write); running processes pick them up
+    on the next question through IndexPool. Uses watchfiles when installed, else polls.
+    """
+
+    def __init__(self, rag=None, raw_dir=RAW_DIR, markdown_dir=MARKDOWN_DIR,
+                 poll_interval: float = 5.0, force_polling: bool = False):
+        if rag is None:
+            from src.BRAIN.RAG import RAGPipeline
+            rag = RAGPipeline()
+        self.rag = rag
+        self.raw_dir = Path(raw_dir)
+        self.markdown_dir = Path(markdown_dir)
+        self.poll_interval = poll_interval
+        self.force_polling = force_polling
+
+    @staticmethod
+    def subject_for(md_path):
+        name = Path(md_path).name
+        return name[:-len(MARKDOWN_SUFFIX)] if name.endswith(MARKDOWN_SUFFIX) else None
+
+    @staticmethod
+    def wait_until_stable(path, checks: int = 3, delay: float = 0.5) -> bool:
+        """Wait until a file stops growing, so half-copied documents are not converted."""
+        last = None
+        stable = 0
+        while stable < checks:
+            try:
+                size = Path(path).stat().st_size
+            except FileNotFoundError:
+                return False
+            stable = stable + 1 if size == last else 0
+            last = size
+            time.sleep(delay)
+        return True
+
+    def convert(self, doc_path) -> bool:
+        doc_path = Path(doc_path)
+        md_path = markdown_path_for(doc_path)
+        if md_path.exists() and md_path.stat().st_mtime >= doc_path.stat().st_mtime:
+            return False
+        if not self.wait_until_stable(doc_path):
+            return False
+        try:
+            print(f"[Ingest] Converting {doc_path}")
+            markdown = convert_to_markdown(doc_path)
+        except Exception as e:
+            print(f"[Ingest Error] {doc_path}: {e}")
+            return False
+        md_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = md_path.with_name(md_path.name + ".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(markdown)
+        try:
+            os.replace(tmp_path, md_path)
+        except PermissionError as e:
+            # On Windows a file held open elsewhere (an editor, a virus scanner) cannot be replaced; retried later.
+            print(f"[Ingest Error] {md_path} is in use: {e}")
+            os.remove(tmp_path)
+            return False
+        return True
+
+    def index(self, md_path):
+        subject = self.subject_for(md_path)
+        if not subject or not Path(md_path).exists():
+            return
+        start = time.perf_counter()
+        store = self.rag.load_or_create_vectorstore(subject)
+        if store is None:
+            return
+        store.close()
+        _, _, index_path = self.rag.get_paths(subject)
+        print(f"[Ingest] {subject} ready ({MmapVectorStore.current_version(index_path) or 'unversioned'}, "
+              f"{time.perf_counter() - start:.1f}s)")
+
+    def handle(self, paths):
+        """Process changed paths: documents first, so their fresh markdown is indexed in the same pass."""
+        markdown = set()
+        for path in sorted(Path(p) for p in paths):
+            if path.parent.resolve() == self.raw_dir.resolve() and path.is_file() and get_document_format(path):
+                if self.convert(path):
+                    markdown.add(markdown_path_for(path))
+            elif path.parent.resolve() == self.markdown_dir.resolve() and path.suffix == ".md":
+                markdown.add(path)
+        for md_path in sorted(markdown):
+            self.index(md_path)
+
+    def snapshot(self):
+        files = {}
+        for directory in (self.raw_dir, self.markdown_dir):
+            if directory.exists():
+                for path in directory.iterdir():
+                    if path.is_file():
+                        stat = path.stat()
+                        files[path] = (stat.st_mtime_ns, stat.st_size)
+        return files
+
+    def scan(self):
+        """Catch up on everything that changed while the daemon was not running."""
+        self.handle(self.snapshot())
+
+    def watch(self):
+        try:
+            if self.force_polling:
+                raise ImportError
+            from watchfiles import watch
+        except ImportError:
+            self.poll()
+            return
+        print(f"[Ingest] Watching {self.raw_dir} and {self.markdown_dir}")
+        for changes in watch(self.raw_dir, self.markdown_dir, recursive=False):
+            self.handle({path for _, path in changes})
+
+    def poll(self):
+        print(f"[Ingest] Polling {self.raw_dir} and {self.markdown_dir} every {self.poll_interval:g}s")
+        previous = self.snapshot()
+        while True:
+            time.sleep(self.poll_interval)
+            current = self.snapshot()
+            changed = [path for path, stamp in current.items() if previous.get(path) != stamp]
+            if changed:
+                self.handle(changed)
+            previous = current
+
+    def run(self):
+        for directory in (self.raw_dir, self.markdown_dir):
+            directory.mkdir(parents=True, exist_ok=True)
+        self.scan()
+        self.watch()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Convert and index knowledge-base files as they change.")
+    parser.add_argument("--poll", action="store_true", help="poll instead of using filesystem events")
+    parser.add_argument("--interval", type=float, default=5.0, help="seconds between polls")
+    parser.add_argument("--once", action="store_true", help="process pending changes and exit")
+    args = parser.parse_args()
+    daemon = IngestionDaemon(poll_interval=args.interval, force_polling=args.poll)
+    if args.once:
+        daemon.scan()
+    else:
+        daemon.run()
@@ -0,0 +1,106 @@
+import json
+import math
+import re
+from collections import Counter, defaultdict
+
+from langchain_core.retrievers import BaseRetriever
+
+
+class BM25Index:
+    """Inverted index over chunk texts, scored with Okapi BM25. Rows match the vectorstore rows."""
+
+    FILE_NAME = "lexical.json"
+    # Keep figures such as "27.8" or "1,027" as single tokens so exact numbers can be matched.
+    TOKEN_PATTERN = re.compile(r"\d+(?:[.,]\d+)*|\w+")
+
+    def __init__(self, postings: dict, doc_lengths: list, k1: float = 1.5, b: float = 0.75):
+        self.postings = postings
+        self.doc_lengths = doc_lengths
+        self.k1 = k1
+        self.b = b
+        self.avg_length = (sum(doc_lengths) / len(doc_lengths)) if doc_lengths else 0.0
+
+    @classmethod
+    def tokenize(cls, text: str):
+        return cls.TOKEN_PATTERN.findall(text.lower())
+
+    @classmethod
+    def named_terms(cls, text: str) -> set:
+        """Numbers and capitalized words after the first, lowercased; they tell "the Latur earthquake" from "the Bhuj one"."""
+        words = cls.TOKEN_PATTERN.findall(text)
+        return {word.lower() for i, word in enumerate(words)
+                if any(ch.isdigit() for ch in word) or (i and word[0].isupper() and word != "I")}
+
+    @classmethod
+    def build(cls, texts):
+        postings = defaultdict(list)
+        doc_lengths = []
+        for row, text in enumerate(texts):
+            tokens = cls.tokenize(text)
+            doc_lengths.append(len(tokens))
+            for term, freq in Counter(tokens).items():
+                postings[term].append((row, freq))
+        return cls(dict(postings), doc_lengths)
+
+    def save(self, path):
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump({"doc_lengths": self.doc_lengths, "postings": self.postings}, f)
+
+    @classmethod
+    def load(cls, path):
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        return cls(data["postings"], data["doc_lengths"])
+
+    def memory_footprint(self) -> int:
+        """Approximate bytes held by the Python postings lists."""
+        n_postings = sum(len(postings) for postings in self.postings.values())
+        return n_postings * 100 + len(self.postings) * 80 + len(self.doc_lengths) * 8
+
+    def search(self, query: str, k: int = 10):
+        """Top `k` (row, score) pairs for `query`."""
+        n_docs = len(self.doc_lengths)
+        scores = defaultdict(float)
+        for term in set(self.tokenize(query)):
+            postings = self.postings.get(term)
+            if not postings:
+                continue
+            idf = math.log(1 + (n_docs - len(postings) + 0.5) / (len(postings) + 0.5))
+            for row, freq in postings:
+                norm = self.k1 * (1 - self.b + self.b * self.doc_lengths[row] / (self.avg_length or 1))
+                scores[row] += idf * freq * (self.k1 + 1) / (freq + norm)
+        return sorted(scores.items(), key=lambda item: item[1], reverse=True)[:k]
+
+
+class HybridRetriever(BaseRetriever):
+    """Fuses vector and BM25 results from one subject index with weighted reciprocal rank fusion."""
+
+    vectorstore: object
+    lexical: object
+    k: int = 2
+    fetch_k: int = 10
+    vector_weight: float = 1.0
+    lexical_weight: float = 1.0
+    rrf_k: int = 60
+
+    def memory_footprint(self) -> int:
+        return self.vectorstore.memory_footprint() + self.lexical.memory_footprint()
+
+    def close(self):
+        self.vectorstore.close()
+
+    def _get_relevant_documents(self, query: str, *, run_manager=None):
+        fused = defaultdict(float)
+        docs = {}
+
+        vector_hits = self.vectorstore.similarity_search_with_score(query, k=self.fetch_k)
+        for rank, (doc, _) in enumerate(vector_hits):
+            row = self.vectorstore.id_to_row[doc.id]
+            docs[row] = doc
+            fused[row] += self.vector_weight / (self.rrf_k + rank + 1)
+
+        for rank, (row, _) in enumerate(self.lexical.search(query, k=self.fetch_k)):
+            fused[row] += self.lexical_weight / (self.rrf_k + rank + 1)
+
+        ranked = sorted(fused, key=fused.get, reverse=True)[:self.k]
+        return [docs[row] if row in docs else self.vectorstore.get_document(row) for row in ranked]
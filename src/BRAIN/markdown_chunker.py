@@ -0,0 +1,207 @@
+import re
+
+from langchain_core.documents import Document
+
+
+class MarkdownChunker:
+    """Splits docling markdown along its heading hierarchy, keeping tables whole.
+
+    Chunks never cross a heading, carry no overlap, and are always a contiguous slice of
+    the source (`start_index`/`end_index` are character offsets into it). Each chunk's
+    metadata holds its section path, e.g. "CHAPTER-I INTRODUCTION > Urbanization".
+    """
+
+    HEADING = re.compile(r"^(#{1,6})\s+(.*?)\s*#*\s*$")
+    BLOCK_SEPARATOR = re.compile(r"\n[ \t]*\n")
+    SENTENCE_END = re.compile(r"(?<=[.!?])\s+")
+
+    def __init__(self, chunk_size: int = 500, max_table_size: int = 4000):
+        self.chunk_size = chunk_size
+        self.max_table_size = max_table_size  # Larger tables are cut between rows
+
+    def signature(self) -> str:
+        """Identifies the chunking settings, so indexes built with other settings get rebuilt."""
+        return f"markdown:{self.chunk_size}:{self.max_table_size}"
+
+    def _blocks(self, text: str):
+        """Yield (start, end, kind) for blank-line separated blocks: heading, table or text."""
+        position = 0
+        for match in list(self.BLOCK_SEPARATOR.finditer(text)) + [None]:
+            end = match.start() if match else len(text)
+            block = text[position:end]
+            stripped = block.strip()
+            if stripped:
+                start = position + (len(block) - len(block.lstrip()))
+                end = start + len(stripped)
+                lines = stripped.splitlines()
+                if len(lines) == 1 and self.HEADING.match(stripped):
+                    yield start, end, "heading"
+                elif all(line.lstrip().startswith("|") for line in lines):
+                    yield start, end, "table"
+                elif any(line.lstrip().startswith("|") for line in lines):
+                    # A caption or note glued to a table: split so the table itself stays whole.
+                    offset = start
+                    for is_table, group in self._group_lines(stripped):
+                        yield offset, offset + len(group), "table" if is_table else "text"
+                        offset += len(group) + 1
+                else:
+                    yield start, end, "text"
+            if match:
+                position = match.end()
+
+    @staticmethod
+    def _group_lines(block: str):
+        groups = []
+        for line in block.split("\n"):
+            is_table = line.lstrip().startswith("|")
+            if groups and groups[-1][0] == is_table:
+                groups[-1][1].append(line)
+            else:
+                groups.append((is_table, [line]))
+        return [(is_table, "\n".join(lines)) for is_table, lines in groups]
+
+    def _split_long(self, text: str, start: int, end: int, kind: str):
+        """Cut an oversized block at row (table) or sentence (text) boundaries."""
+        limit = self.max_table_size if kind == "table" else self.chunk_size
+        if end - start <= limit:
+            return [(start, end)]
+        if kind == "table":
+            boundaries = [m.end() for m in re.finditer(r"\n", text[start:end])]
+        else:
+            boundaries = [m.start() for m in self.SENTENCE_END.finditer(text[start:end])]
+        pieces = []
+        piece_start = start
+        last_cut = None
+        for boundary in boundaries:
+            cut = start + boundary
+            if cut - piece_start > limit and last_cut and last_cut > piece_start:
+                pieces.append((piece_start, last_cut))
+                piece_start = last_cut
+            last_cut = cut
+        if end - piece_start > limit and last_cut and last_cut > piece_start:
+            pieces.append((piece_start, last_cut))
+            piece_start = last_cut
+        pieces.append((piece_start, end))
+        # Sentences longer than the limit on their own are cut hard.
+        result = []
+        for piece_start, piece_end in pieces:
+            while piece_end - piece_start > limit * 2:
+                result.append((piece_start, piece_start + limit))
+                piece_start += limit
+            result.append((piece_start, piece_end))
+        trimmed = []
+        for piece_start, piece_end in result:
+            piece = text[piece_start:piece_end]
+            if piece.strip():
+                trimmed.append((piece_start + len(piece) - len(piece.lstrip()),
+                                piece_end - (len(piece) - len(piece.rstrip()))))
+        return trimmed
+
+    def split_text(self, text: str):
+        """Return [(start, end, section_path)] spans covering the content of `text`."""
+        spans = []
+        sections = []  # [(level, title)]
+        current = None  # [start, end, section_path, has_content]
+
+        def flush():
+            if current and current[3]:
+                spans.append((current[0], current[1], current[2]))
+
+        for start, end, kind in self._blocks(text):
+            if kind == "heading":
+                match = self.HEADING.match(text[start:end])
+                level = len(match.group(1))
+                while sections and sections[-1][0] >= level:
+                    sections.pop()
+                sections.append((level, match.group(2)))
+                path = " > ".join(title for _, title in sections)
+                if current and not current[3]:
+                    # Consecutive headings: fold them into the chunk of the section that follows.
+                    current[1], current[2] = end, path
+                else:
+                    flush()
+                    current = [start, end, path, False]
+                continue
+
+            path = current[2] if current else ""
+            for piece_start, piece_end in self._split_long(text, start, end, kind):
+                if current and (not current[3] or piece_end - current[0] <= self.chunk_size):
+                    current[1], current[3] = piece_end, True
+                    # A heading plus an oversized block still stays together, like a whole table.
+                    continue
+                flush()
+                current = [piece_start, piece_end, path, True]
+        flush()
+        return spans
+
+    def tables(self, text: str):
+        """Yield (start, end, section_path) for every markdown table in `text`."""
+        sections = []
+        for start, end, kind in self._blocks(text):
+            if kind == "heading":
+                match = self.HEADING.match(text[start:end])
+                level = len(match.group(1))
+                while sections and sections[-1][0] >= level:
+                    sections.pop()
+                sections.append((level, match.group(2)))
+            elif kind == "table":
+                yield start, end, " > ".join(title for _, title in sections)
+
+    def create_documents(self, text: str, source: str = None):
+        documents = []
+        for start, end, section in self.split_text(text):
+            metadata = {"section": section, "start_index": start, "end_index": end}
+            if source:
+                metadata["source"] = source
+            documents.append(Document(page_content=text[start:end], metadata=metadata))
+        return documents
+
+
+def _benchmark(use_ollama: bool = False, k: int = 2, chunk_size: int = 500):
+    """Compare this chunker with the old RecursiveCharacterTextSplitter(500, 100) on DATA/KNOWLEDGEBASE."""
+    import time
+    from pathlib import Path
+
+    import numpy as np
+    from langchain.text_splitter import RecursiveCharacterTextSplitter
+    from src.BRAIN.embedding_pipeline import EmbeddingPipeline, HashEmbedder
+
+    if use_ollama:
+        from langchain_ollama import OllamaEmbeddings
+        from src.FUNCTION.Tools.get_env import EnvManager
+        embedder = OllamaEmbeddings(model=EnvManager.load_variable("Embedding_model"))
+    else:
+        embedder = HashEmbedder()
+    pipeline = EmbeddingPipeline(embedder, progress=None)
+    normalize = lambda s: " ".join(s.split())
+
+    splitters = {
+        "recursive 500/100": RecursiveCharacterTextSplitter(chunk_size=500, chunk_overlap=100).split_text,
+        f"markdown {chunk_size}": lambda text: [d.page_content for d in MarkdownChunker(chunk_size).create_documents(text)],
+    }
+    for md_path in sorted(Path("./DATA/KNOWLEDGEBASE").glob("*.md")):
+        text = md_path.read_text(encoding="utf-8")
+        # Queries: every 25th prose sentence of 8+ words; a hit is a top-k chunk containing the whole sentence.
+        sentences = [s.strip() for s in re.split(r"(?<=[.!?])\s+", text)
+                     if len(s.split()) >= 8 and "|" not in s and not s.lstrip().startswith("#")][::25]
+        print(f"\n{md_path.name}: {len(text) / 2 ** 20:.2f} MB, {len(sentences)} probe sentences")
+        for name, split in splitters.items():
+            chunks = split(text)
+            start = time.perf_counter()
+            vectors = np.asarray(pipeline.embed_documents(chunks), dtype=np.float32)
+            embed_time = time.perf_counter() - start
+            index_bytes = vectors.nbytes + sum(len(c.encode("utf-8")) for c in chunks)
+
+            query_vectors = np.asarray(pipeline.embed_documents(sentences), dtype=np.float32)
+            top_k = np.argsort(-(query_vectors @ vectors.T), axis=1)[:, :k]
+            normalized = [normalize(c) for c in chunks]
+            hits = sum(any(normalize(s) in normalized[row] for row in rows) for s, rows in zip(sentences, top_k))
+            print(f"  {name:20s} chunks={len(chunks):5d}  index={index_bytes / 2 ** 20:6.2f} MB  "
+                  f"embed={embed_time:6.2f}s  hit@{k}={hits / max(1, len(sentences)):.1%}")
+
+
+if __name__ == "__main__":
+    # python -m src.BRAIN.markdown_chunker [--ollama]
+    import sys
+
+    _benchmark(use_ollama="--ollama" in sys.argv)
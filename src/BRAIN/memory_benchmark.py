@@ -0,0 +1,166 @@
+import argparse
+import json
+import random
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+from fuzzywuzzy import fuzz
+
+from src.BRAIN.chat_memory_store import ChatMemoryStore
+
+FUNCTION_WORDS = "i my me am is was have has the a to and in of at with about really very always never lately".split()
+SYLLABLES = "ka ri mo san te lu vi da ne po ha chi ro mi to be la su ze go".split()
+
+
+def make_vocabulary(size: int, seed: int):
+    """Pseudo-words standing in for the names, places and topics of personal memories."""
+    rng = random.Random(seed)
+    words = sorted({"".join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 4))) for _ in range(size * 2)})
+    rng.shuffle(words)
+    return words[:size]
+
+
+def percentiles(values):
+    if not values:
+        return {"p50": 0.0, "p95": 0.0, "p99": 0.0}
+    p50, p95, p99 = np.percentile(values, [50, 95, 99])
+    return {"p50": float(p50), "p95": float(p95), "p99": float(p99)}
+
+
+def fuzzy_score(a: str, b: str) -> int:
+    return max(fuzz.token_sort_ratio(a, b), fuzz.token_set_ratio(a, b))
+
+
+def make_prompt(rng: random.Random, vocabulary) -> str:
+    # Function words plus Zipf-distributed content words, so common topics recur across memories.
+    words = [rng.choice(FUNCTION_WORDS) if rng.random() < 0.4
+             else vocabulary[min(int(rng.paretovariate(1.0)) - 1, len(vocabulary) - 1)] if rng.random() < 0.3
+             else rng.choice(vocabulary)
+             for _ in range(rng.randint(6, 14))]
+    return " ".join(words)
+
+
+PERTURBATIONS = ("shuffle", "typo", "insert", "extend", "subset")
+
+
+def perturb(prompt: str, rng: random.Random, kind: str, vocabulary) -> str:
+    """A rephrasing of `prompt` that the fuzzy check should treat as the same memory.
+
+    "extend" restates it with more detail and "subset" keeps only part of it; the fuzzy
+    token-set score of either pair is 100 although their shingles overlap little.
+    """
+    words = prompt.split()
+    if kind == "shuffle":
+        rng.shuffle(words)
+    elif kind == "typo":
+        i = rng.randrange(len(words))
+        word = words[i]
+        if len(word) > 3:
+            j = rng.randrange(len(word) - 1)
+            words[i] = word[:j] + word[j + 1] + word[j] + word[j + 2:]
+    elif kind == "insert":
+        words.insert(rng.randrange(len(words) + 1), rng.choice(FUNCTION_WORDS))
+    elif kind == "extend":
+        words += make_prompt(rng, vocabulary).split()
+    else:
+        length = rng.randint(max(2, len(words) // 3), max(2, len(words) // 2))
+        start = rng.randrange(len(words) - length + 1)
+        words = words[start:start + length]
+    return " ".join(words)
+
+
+def first_match(rows, prompt: str, threshold: int):
+    for entry_id, user in rows:
+        if fuzzy_score(prompt, user) >= threshold:
+            return entry_id
+    return None
+
+
+def run(sizes=(100, 10_000, 100_000), n_queries: int = 100, brute_queries: int = 20, threshold: int = 80,
+        seed: int = 0):
+    """For each history size, compare the full fuzzy scan with the MinHash candidate lookup."""
+    rng = random.Random(seed)
+    vocabulary = make_vocabulary(20_000, seed)
+    report = {"threshold": threshold, "sizes": {}}
+    for size in sizes:
+        prompts = [make_prompt(rng, vocabulary) for _ in range(size)]
+        with tempfile.TemporaryDirectory() as tmp:
+            store = ChatMemoryStore(Path(tmp) / "chat_history.sqlite", max_entries=size, legacy_json=None)
+            start = time.perf_counter()
+            store.add_many({"user": p, "assistant": "", "timestamp": None} for p in prompts)
+            build_s = time.perf_counter() - start
+            rows = [(e["id"], e["user"]) for e in store.all()]
+
+            # Half the queries rephrase a stored prompt, cycling through the perturbations; half are new.
+            queries = []
+            for i in range(n_queries):
+                if i % 2 == 0:
+                    kind = PERTURBATIONS[i // 2 % len(PERTURBATIONS)]
+                    queries.append((kind, perturb(rng.choice(prompts), rng, kind, vocabulary)))
+                else:
+                    queries.append(("new", make_prompt(rng, vocabulary)))
+            lookup_ms, candidates = [], []
+            for _, query in queries:
+                start = time.perf_counter()
+                rows_found = store._candidates(query).fetchall()
+                first_match(rows_found, query, threshold)
+                lookup_ms.append((time.perf_counter() - start) * 1000)
+                candidates.append(len(rows_found))
+
+            # The full scan is slow at large sizes, so recall is measured on a subset of the queries.
+            # Recall is reported per perturbation and for new prompts that happen to clear the threshold.
+            brute_ms = []
+            found = dict.fromkeys(PERTURBATIONS + ("new",), 0)
+            agreed = dict(found)
+            for kind, query in queries[:brute_queries]:
+                start = time.perf_counter()
+                expected = first_match(rows, query, threshold)
+                brute_ms.append((time.perf_counter() - start) * 1000)
+                if expected is not None:
+                    found[kind] += 1
+                    agreed[kind] += first_match(store._candidates(query).fetchall(), query, threshold) is not None
+            store.close()
+
+        report["sizes"][size] = {
+            "build_s": build_s,
+            "candidates_mean": float(np.mean(candidates)),
+            "lsh_ms": percentiles(lookup_ms),
+            "scan_ms": percentiles(brute_ms),
+            "rephrased": sum(found[kind] for kind in PERTURBATIONS),
+            "recall": sum(agreed[kind] for kind in PERTURBATIONS) / max(1, sum(found[kind] for kind in PERTURBATIONS)),
+            "recall_by_kind": {kind: agreed[kind] / found[kind] if found[kind] else 1.0 for kind in PERTURBATIONS},
+            "incidental": found["new"],
+            "incidental_recall": agreed["new"] / found["new"] if found["new"] else 1.0,
+        }
+    return report
+
+
+def print_report(report):
+    print(f"Near-duplicate lookup in store_important_chat (fuzzy threshold {report['threshold']})")
+    print(f"{'memories':>9s} {'build s':>8s} {'cands':>7s} {'lsh p50':>8s} {'lsh p95':>8s} "
+          f"{'scan p50':>9s} {'scan p95':>9s} {'recall':>7s}")
+    for size, r in report["sizes"].items():
+        print(f"{size:9d} {r['build_s']:8.2f} {r['candidates_mean']:7.1f} {r['lsh_ms']['p50']:8.2f} "
+              f"{r['lsh_ms']['p95']:8.2f} {r['scan_ms']['p50']:9.2f} {r['scan_ms']['p95']:9.2f} "
+              f"{r['recall']:7.2f}  ({r['rephrased']} rephrased; {r['incidental']} incidental matches, "
+              f"{r['incidental_recall']:.2f} found)")
+        by_kind = ", ".join(f"{kind} {recall:.2f}" for kind, recall in r["recall_by_kind"].items())
+        print(f"{'':10s}recall by rephrasing: {by_kind}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Full fuzzy scan vs MinHash candidates for chat memory duplicates.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100, 10_000, 100_000])
+    parser.add_argument("--queries", type=int, default=100, help="lookups timed per size")
+    parser.add_argument("--scan-queries", type=int, default=20, help="of those, how many also run the full scan")
+    parser.add_argument("--threshold", type=int, default=80)
+    parser.add_argument("--json", help="also write the report to this file")
+    args = parser.parse_args()
+
+    report = run(args.sizes, n_queries=args.queries, brute_queries=args.scan_queries, threshold=args.threshold)
+    print_report(report)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=4)
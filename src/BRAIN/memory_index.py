@@ -0,0 +1,99 @@
+import hashlib
+import json
+import os
+import threading
+from pathlib import Path
+
+import faiss
+import numpy as np
+
+
+class MemoryIndex:
+    """Embeddings of stored personal-chat exchanges, kept on disk and updated one entry at a time.
+
+    Entries are keyed by the hash of their text, so the index can be reconciled with the chat
+    history cheaply: only texts it has not seen are embedded, and a query costs one embedding.
+    """
+
+    VECTORS_FILE = "vectors.npy"
+    KEYS_FILE = "keys.json"
+
+    def __init__(self, embedder, path="./DATA/chat_memory_index"):
+        self.embedder = embedder
+        self.path = Path(path)
+        self.keys = []
+        self.vectors = None  # float32 matrix, one row per key
+        self._lock = threading.Lock()
+        self.load()
+
+    @staticmethod
+    def key_for(text: str) -> str:
+        return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+    def load(self):
+        try:
+            with open(self.path / self.KEYS_FILE, "r", encoding="utf-8") as f:
+                keys = json.load(f)
+            vectors = np.load(self.path / self.VECTORS_FILE)
+        except (OSError, ValueError):
+            return
+        if len(keys) == len(vectors):
+            self.keys, self.vectors = keys, vectors
+
+    def save(self):
+        self.path.mkdir(parents=True, exist_ok=True)
+        # Vectors first: a crash (or another process saving) in between leaves a length mismatch,
+        # which load() ignores and sync() repairs.
+        suffix = f"{os.getpid()}.{threading.get_ident()}.tmp"
+        tmp_vectors = self.path / f"{self.VECTORS_FILE}.{suffix}.npy"
+        np.save(tmp_vectors, self.vectors if self.vectors is not None else np.zeros((0, 0), dtype=np.float32))
+        os.replace(tmp_vectors, self.path / self.VECTORS_FILE)
+        tmp_keys = self.path / f"{self.KEYS_FILE}.{suffix}"
+        with open(tmp_keys, "w", encoding="utf-8") as f:
+            json.dump(self.keys, f)
+        os.replace(tmp_keys, self.path / self.KEYS_FILE)
+
+    def _add(self, texts):
+        new = [(self.key_for(text), text) for text in dict.fromkeys(texts) if self.key_for(text) not in self.keys]
+        if not new:
+            return False
+        vectors = np.asarray(self.embedder.embed_documents([text for _, text in new]), dtype=np.float32)
+        self.vectors = vectors if self.vectors is None or not len(self.keys) else np.vstack([self.vectors, vectors])
+        self.keys.extend(key for key, _ in new)
+        return True
+
+    def _remove(self, keys):
+        keys = set(keys)
+        keep = [row for row, key in enumerate(self.keys) if key not in keys]
+        if len(keep) == len(self.keys):
+            return False
+        self.keys = [self.keys[row] for row in keep]
+        self.vectors = self.vectors[keep] if self.vectors is not None else None
+        return True
+
+    def update(self, added=(), removed=()):
+        """Embed the `added` texts (one call for all of them) and drop the `removed` ones."""
+        with self._lock:
+            changed = self._remove(self.key_for(text) for text in removed)
+            changed = self._add(added) or changed
+            if changed:
+                self.save()
+
+    def sync(self, texts):
+        """Make the index hold exactly `texts`, embedding only those it does not have yet."""
+        wanted = {self.key_for(text): text for text in texts}
+        with self._lock:
+            changed = self._remove([key for key in self.keys if key not in wanted])
+            changed = self._add(text for key, text in wanted.items() if key not in self.keys) or changed
+            if changed:
+                self.save()
+
+    def search(self, query: str, k: int = 7):
+        """[(key, squared L2 distance)] of the `k` nearest entries to `query`."""
+        with self._lock:
+            if not self.keys:
+                return []
+            keys, vectors = list(self.keys), self.vectors
+        query_vector = np.asarray(self.embedder.embed_query(query), dtype=np.float32).reshape(1, -1)
+        distances, rows = faiss.knn(query_vector, vectors, min(k, len(keys)))
+        return [(keys[row], float(distance)) for distance, row in zip(distances[0], rows[0]) if row != -1]
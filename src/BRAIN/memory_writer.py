@@ -0,0 +1,110 @@
+import atexit
+import queue
+import threading
+import time
+
+_STOP = object()
+
+
+class MemoryWriter:
+    """Stores personal-chat exchanges on a background thread, so replies do not wait for it.
+
+    `submit` only enqueues. The worker collects whatever arrives within `coalesce_seconds` of
+    the first pending exchange, keeps the latest response per prompt (the store would replace
+    the earlier one anyway) and passes each to `store(prompt, response)` in arrival order.
+    Pending exchanges are written before the interpreter exits (atexit) or when `close` is called.
+    """
+
+    def __init__(self, store, coalesce_seconds: float = 0.5, max_batch: int = 32):
+        self.store = store
+        self.coalesce_seconds = coalesce_seconds
+        self.max_batch = max_batch
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()  # Orders submissions against the stop marker
+        self._closed = False
+        self.submitted = 0
+        self.written = 0
+        self.coalesced = 0
+        self.failed = 0
+        self._thread = threading.Thread(target=self._run, name="memory-writer", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def submit(self, prompt: str, response: str):
+        with self._lock:
+            if not self._closed:
+                self.submitted += 1
+                self._queue.put((prompt, response))
+                return
+        # Late submissions after shutdown are written inline rather than lost.
+        self._write([(prompt, response)])
+
+    def _collect(self, first):
+        batch = [first]
+        if first is _STOP:
+            return batch
+        deadline = time.monotonic() + self.coalesce_seconds
+        while len(batch) < self.max_batch:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                item = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                break
+            batch.append(item)
+            if item is _STOP:
+                break
+        return batch
+
+    def _write(self, pairs):
+        latest = {}
+        for prompt, response in pairs:
+            key = " ".join(prompt.lower().split())
+            latest.pop(key, None)  # Re-insert so the exchange keeps its latest position
+            latest[key] = (prompt, response)
+        self.coalesced += len(pairs) - len(latest)
+        for prompt, response in latest.values():
+            try:
+                self.store(prompt, response)
+                self.written += 1
+            except Exception as e:
+                self.failed += 1
+                print(f"[Memory Error] Could not store exchange: {e}")
+
+    def _run(self):
+        while True:
+            batch = self._collect(self._queue.get())
+            stop = any(item is _STOP for item in batch)
+            try:
+                self._write([item for item in batch if item is not _STOP])
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+            if stop:
+                return
+
+    def flush(self):
+        """Block until every exchange submitted so far has been written."""
+        self._queue.join()
+
+    def close(self, timeout: float = 30.0):
+        """Write what is pending and stop the worker."""
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            self._queue.put(_STOP)
+        self._thread.join(timeout)
+        if self._thread.is_alive():
+            print(f"[Memory Error] Writer still busy after {timeout:g}s; pending exchanges may be lost")
+        atexit.unregister(self.close)
+
+    def stats(self) -> dict:
+        return {
+            "pending": self._queue.qsize(),
+            "submitted": self.submitted,
+            "written": self.written,
+            "coalesced": self.coalesced,
+            "failed": self.failed,
+        }
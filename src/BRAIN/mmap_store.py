@@ -0,0 +1,459 @@
+import json
+import mmap
+import os
+import shutil
+import sys
+import time
+from pathlib import Path
+
+import faiss
+import numpy as np
+from langchain_core.documents import Document
+from langchain_core.vectorstores import VectorStore
+
+from src.BRAIN.chunk_manifest import ChunkManifest
+
+INDEX_TYPES = ("flat", "hnsw", "ivfpq")
+HNSW_MIN_CHUNKS = 20_000    # "auto" switches from exact search to HNSW at this many chunks
+IVFPQ_MIN_CHUNKS = 500_000  # ... and to compressed IVF-PQ at this many
+HNSW_M = 32
+HNSW_EF_SEARCH = 64
+IVF_NPROBE = 16
+IVFPQ_RERANK = 8  # IVF-PQ fetches k * this many candidates, re-ranked by exact distance on vectors.npy
+
+
+def choose_index_type(index_type: str, n_chunks: int) -> str:
+    """Resolve "auto" (or None) to an index type by corpus size."""
+    if index_type and index_type != "auto":
+        if index_type not in INDEX_TYPES:
+            raise ValueError(f"Unknown index type '{index_type}', expected one of {INDEX_TYPES} or 'auto'")
+        return index_type
+    if n_chunks >= IVFPQ_MIN_CHUNKS:
+        return "ivfpq"
+    if n_chunks >= HNSW_MIN_CHUNKS:
+        return "hnsw"
+    return "flat"
+
+
+def build_ann_index(vectors: np.ndarray, index_type: str):
+    """Approximate index over `vectors` (L2), or None for "flat", which is searched exactly."""
+    n, dim = vectors.shape
+    if index_type == "flat" or n == 0:
+        return None
+    if index_type == "hnsw":
+        index = faiss.IndexHNSWFlat(dim, HNSW_M)
+        index.hnsw.efConstruction = 80
+    elif index_type == "ivfpq":
+        # k-means wants ~39 training points per list; PQ sub-vectors must split the dimension evenly.
+        nlist = max(1, min(int(4 * np.sqrt(n)), n // 39))
+        m = next((m for m in range(min(64, dim // 4), 0, -1) if dim % m == 0), 1)
+        nbits = 8 if n >= 39 * 256 else 4
+        index = faiss.IndexIVFPQ(faiss.IndexFlatL2(dim), dim, nlist, m, nbits)
+        index.train(vectors)
+    else:
+        raise ValueError(f"Unknown index type '{index_type}'")
+    index.add(vectors)
+    return index
+
+
+def tune_index(index):
+    if index is None:
+        return
+    if hasattr(index, "hnsw"):
+        index.hnsw.efSearch = HNSW_EF_SEARCH
+    if hasattr(index, "nprobe"):
+        index.nprobe = min(IVF_NPROBE, index.nlist)
+
+
+def search_index(index, vectors, queries, k: int, rerank: int = IVFPQ_RERANK):
+    """(distances, rows) of the `k` nearest `vectors` to each query, through `index` when there is one.
+
+    IVF-PQ distances come from compressed codes, so its top `k * rerank` candidates are re-scored
+    against the full vectors (the idea of faiss.IndexRefineFlat, without keeping a second copy).
+    """
+    queries = np.asarray(queries, dtype=np.float32).reshape(-1, vectors.shape[1])
+    k = min(k, len(vectors))
+    if index is None:
+        return faiss.knn(queries, vectors, k)
+    if not isinstance(index, faiss.IndexIVFPQ) or rerank <= 1:
+        return index.search(queries, k)
+    _, candidates = index.search(queries, min(k * rerank, len(vectors)))
+    distances = np.full((len(queries), k), np.inf, dtype=np.float32)
+    rows = np.full((len(queries), k), -1, dtype=np.int64)
+    for i, found in enumerate(candidates):
+        found = np.unique(found[found != -1])  # Sorted rows read the memory map sequentially
+        exact = ((np.asarray(vectors[found], dtype=np.float32) - queries[i]) ** 2).sum(axis=1)
+        best = np.argsort(exact)[:k]
+        distances[i, :len(best)] = exact[best]
+        rows[i, :len(best)] = found[best]
+    return distances, rows
+
+
+def byte_offsets(raw: bytes, char_offsets):
+    """{char offset: byte offset} for offsets into the text of `raw` as text-mode `open` reads it.
+
+    Text mode turns CRLF/CR line endings into "\n", so on Windows-written markdown the two drift apart.
+    """
+    wanted = sorted(set(char_offsets))
+    result = {}
+    position = 0  # Characters of translated text before the current line
+    byte_position = 0
+    i = 0
+    for line in raw.splitlines(keepends=True):
+        content = line.rstrip(b"\r\n")
+        decoded = content.decode("utf-8")
+        line_end = position + len(decoded) + (1 if len(content) < len(line) else 0)
+        while i < len(wanted) and wanted[i] < line_end:
+            result[wanted[i]] = byte_position + len(decoded[:wanted[i] - position].encode("utf-8"))
+            i += 1
+        position = line_end
+        byte_position += len(line)
+    for offset in wanted[i:]:
+        result[offset] = byte_position
+    return result
+
+
+class SourceChangedError(RuntimeError):
+    """The markdown a source-backed index points into no longer matches the indexed content."""
+
+
+class MmapVectorStore(VectorStore):
+    """Read-only vectorstore whose vectors and chunk texts are memory-mapped from disk.
+
+    A subject directory holds:
+      vectors.npy  float32 matrix, one row per chunk (the flat index)
+      chunks.bin   UTF-8 chunk texts, concatenated
+      offsets.npy  int64 (start, end) byte range of each chunk in chunks.bin
+      chunks.json  chunk ids, metadata and index type
+                   (plus the source file, for indexes written with `source`)
+      source.md    hard link to (or, where linking fails, copy of) the source markdown, for
+                   indexes written with `source`
+      index.faiss  native faiss HNSW / IVF-PQ index, only for approximate index types
+
+    Opening a subject maps the files instead of unpickling them, so only the pages
+    a query touches are read, and processes serving the same subject share them
+    through the OS page cache. Indexes written with `source` have no chunks.bin: their
+    offsets point into source.md, the markdown as it was when the index was built, which is
+    mapped instead. As a hard link it takes no extra space, and replacing the markdown with a
+    new file (as the ingestion daemon does) leaves it untouched. A file edited in place changes
+    the link too, so its size and mtime are checked before each read and SourceChangedError is
+    raised instead of returning shifted text.
+
+    Each build goes into its own version directory inside the subject directory, and the
+    CURRENT file names the live one. Replacing CURRENT is atomic, so processes that have
+    the subject open keep their version until they reload, and new loads never see a
+    half-written index. Subject directories written before versioning hold the files directly.
+    """
+
+    VECTORS_FILE = "vectors.npy"
+    CHUNKS_FILE = "chunks.bin"
+    OFFSETS_FILE = "offsets.npy"
+    META_FILE = "chunks.json"
+    INDEX_FILE = "index.faiss"
+    SOURCE_FILE = "source.md"
+    CURRENT_FILE = "CURRENT"
+    STALE_TMP_SECONDS = 3600  # Unfinished builds older than this are assumed crashed and removed
+
+    def __init__(self, path, embedding, vectors, chunk_file, chunk_data, offsets, ids, metadatas,
+                 index=None, index_type="flat", source=None, source_stat=None):
+        self.path = Path(path)
+        self.source = source  # Path of the markdown the offsets point into, or None if texts are in chunks.bin
+        self.source_stat = source_stat  # (size, mtime_ns) the mapped source must still have, if it can change
+        self.embedding = embedding
+        self.vectors = vectors
+        self._chunk_file = chunk_file
+        self._chunk_data = chunk_data
+        self.offsets = offsets
+        self.ids = ids
+        self.metadatas = metadatas
+        self.index = index
+        self.index_type = index_type
+        self.id_to_row = {chunk_id: row for row, chunk_id in enumerate(ids)}
+
+    @property
+    def embeddings(self):
+        return self.embedding
+
+    @classmethod
+    def current_version(cls, path):
+        """Name of the live version of a subject directory, or None if it is unversioned or missing."""
+        try:
+            return (Path(path) / cls.CURRENT_FILE).read_text(encoding="utf-8").strip() or None
+        except FileNotFoundError:
+            return None
+
+    @classmethod
+    def resolve(cls, path) -> Path:
+        """Directory holding the files of the live version of a subject."""
+        version = cls.current_version(path)
+        return Path(path) / version if version else Path(path)
+
+    @classmethod
+    def exists(cls, path) -> bool:
+        return (cls.resolve(path) / cls.META_FILE).exists()
+
+    @staticmethod
+    def describe_source(source_path, sha256: str, stat=None) -> dict:
+        """Identity of a source file, recorded so a changed file is detected before it is read from.
+
+        Pass the `os.stat_result` taken before the file was read, so a write in between is noticed.
+        """
+        stat = stat or Path(source_path).stat()
+        return {"path": str(source_path), "size": stat.st_size, "mtime_ns": stat.st_mtime_ns, "sha256": sha256}
+
+    @classmethod
+    def check_source(cls, source_path, recorded: dict):
+        stat = source_path.stat()
+        if stat.st_size == recorded["size"] and stat.st_mtime_ns == recorded["mtime_ns"]:
+            return
+        # Touched or copied: only the content decides.
+        if stat.st_size != recorded["size"] or ChunkManifest.hash_file(source_path) != recorded["sha256"]:
+            raise SourceChangedError(f"{source_path} changed since it was indexed")
+
+    @classmethod
+    def load(cls, path, embedding, verify_source: bool = True):
+        """Open a subject. With `verify_source=False` a changed source is not an error (its texts may then be wrong)."""
+        path = cls.resolve(path)
+        with open(path / cls.META_FILE, "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        vectors = np.load(path / cls.VECTORS_FILE, mmap_mode="r")
+        offsets = np.load(path / cls.OFFSETS_FILE, mmap_mode="r")
+        source = None
+        mutable = False  # Whether the mapped source can change under us (checked on every read)
+        recorded = meta.get("source")
+        if recorded and recorded.get("snapshot"):
+            source = path / recorded["snapshot"]
+            # A hard link shares its content (and size and mtime) with the markdown, so an in-place edit reaches it.
+            mutable = recorded.get("linked", False)
+            if mutable and verify_source:
+                cls.check_source(source, recorded)
+        elif recorded:
+            # Written before sources were linked into the version: offsets point into the live file.
+            source = (path / recorded["path"]).resolve()
+            if verify_source:
+                cls.check_source(source, recorded)
+            mutable = True
+        chunk_file = open(source or path / cls.CHUNKS_FILE, "rb")
+        # mmap refuses empty files; an empty subject simply has no chunk data.
+        stat = os.fstat(chunk_file.fileno())
+        size = stat.st_size
+        chunk_data = mmap.mmap(chunk_file.fileno(), 0, access=mmap.ACCESS_READ) if size else b""
+        index = None
+        if (path / cls.INDEX_FILE).exists():
+            index = faiss.read_index(str(path / cls.INDEX_FILE), faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY)
+            tune_index(index)
+        return cls(path, embedding, vectors, chunk_file, chunk_data, offsets, meta["ids"], meta["metadatas"],
+                   index=index, index_type=meta.get("index_type", "flat"), source=source,
+                   source_stat=(stat.st_size, stat.st_mtime_ns) if mutable and verify_source else None)
+
+    @classmethod
+    def write(cls, path, ids, texts, vectors, metadatas, sidecars=(), index_type="flat", source=None, spans=None):
+        """Write a new version of a subject directory and make it the live one once complete.
+
+        `index_type` is "flat", "hnsw" or "ivfpq". Each callable in `sidecars` receives the new
+        version directory and may add files next to the index. With `source` (from
+        `describe_source`) and `spans`, the (start, end) byte range of each chunk in that file,
+        the file is linked into the version instead of the chunk texts being copied; `texts` is
+        then only used for its length. SourceChangedError is raised if the file no longer has the
+        recorded hash.
+        """
+        path = Path(path)
+        path.mkdir(parents=True, exist_ok=True)
+        version = f"v{time.time_ns()}"
+        tmp_path = path / f"{version}.tmp"
+        tmp_path.mkdir()
+
+        meta = {"ids": list(ids), "metadatas": list(metadatas), "index_type": index_type}
+        if source is not None:
+            offsets = np.asarray(spans, dtype=np.int64).reshape(len(ids), 2)
+            snapshot = tmp_path / cls.SOURCE_FILE
+            linked = sys.platform != "win32"  # Windows cannot replace a file while a link to it is mapped
+            if linked:
+                try:
+                    os.link(source["path"], snapshot)
+                except OSError:  # Other filesystem, or one without hard links
+                    linked = False
+            if not linked:
+                shutil.copyfile(source["path"], snapshot)
+            if ChunkManifest.hash_file(snapshot) != source["sha256"]:
+                # Edited after it was chunked: the spans would not match the copy.
+                shutil.rmtree(tmp_path, ignore_errors=True)
+                raise SourceChangedError(f"{source['path']} changed while it was being indexed")
+            try:
+                relative = os.path.relpath(Path(source["path"]).resolve(), (path / version).resolve())
+            except ValueError:  # Different drive on Windows
+                relative = str(Path(source["path"]).resolve())
+            meta["source"] = {**source, "path": relative, "snapshot": cls.SOURCE_FILE, "linked": linked}
+        else:
+            offsets = np.zeros((len(texts), 2), dtype=np.int64)
+            position = 0
+            with open(tmp_path / cls.CHUNKS_FILE, "wb") as f:
+                for row, text in enumerate(texts):
+                    data = text.encode("utf-8")
+                    f.write(data)
+                    offsets[row] = (position, position + len(data))
+                    position += len(data)
+        np.save(tmp_path / cls.OFFSETS_FILE, offsets)
+        matrix = np.ascontiguousarray(np.asarray(vectors, dtype=np.float32).reshape(len(ids), -1))
+        np.save(tmp_path / cls.VECTORS_FILE, matrix)
+        index = build_ann_index(matrix, index_type)
+        if index is not None:
+            faiss.write_index(index, str(tmp_path / cls.INDEX_FILE))
+        with open(tmp_path / cls.META_FILE, "w", encoding="utf-8") as f:
+            json.dump(meta, f)
+        for sidecar in sidecars:
+            sidecar(tmp_path)
+        os.replace(tmp_path, path / version)
+
+        current = cls.current_version(path)
+        if current and current > version:
+            # A build that started later already finished; keep it.
+            shutil.rmtree(path / version, ignore_errors=True)
+            return
+        pointer = path / f"{cls.CURRENT_FILE}.{version}.tmp"
+        pointer.write_text(version, encoding="utf-8")
+        os.replace(pointer, path / cls.CURRENT_FILE)
+        cls._remove_stale(path, version)
+
+    @classmethod
+    def _remove_stale(cls, path, version: str):
+        """Delete older versions, crashed builds and files of the unversioned layout."""
+        # Processes may still map old files; on Windows they cannot be removed yet and are retried next build.
+        for entry in path.iterdir():
+            name = entry.name
+            if name in (version, cls.CURRENT_FILE):
+                continue
+            if entry.is_dir():
+                if name.endswith(".tmp"):
+                    if time.time() - entry.stat().st_mtime > cls.STALE_TMP_SECONDS:
+                        shutil.rmtree(entry, ignore_errors=True)
+                elif name.startswith("v") and name < version:
+                    shutil.rmtree(entry, ignore_errors=True)
+            elif not name.endswith(".tmp"):
+                try:
+                    entry.unlink()
+                except OSError:
+                    pass
+
+    def close(self):
+        if isinstance(self._chunk_data, mmap.mmap):
+            self._chunk_data.close()
+        self._chunk_file.close()
+        # numpy unmaps the vector and offset files once nothing references the arrays.
+        self.vectors = self.offsets = self.index = None
+
+    def get_text(self, row: int) -> str:
+        if self.source_stat:
+            stat = os.fstat(self._chunk_file.fileno())
+            if (stat.st_size, stat.st_mtime_ns) != self.source_stat:
+                raise SourceChangedError(f"{self.source} changed since it was indexed")
+        start, end = self.offsets[row]
+        text = self._chunk_data[start:end].decode("utf-8")
+        if self.source is not None:
+            # Chunks were cut from the newline-translated text, as open(..., "r") reads the source.
+            text = text.replace("\r\n", "\n").replace("\r", "\n")
+        return text
+
+    def get_document(self, row: int) -> Document:
+        metadata = dict(self.metadatas[row])
+        if self.source is not None:
+            start, end = self.offsets[row]
+            metadata.update({"byte_offset": int(start), "byte_length": int(end - start)})
+        return Document(page_content=self.get_text(row), metadata=metadata, id=self.ids[row])
+
+    def get_vector(self, chunk_id: str):
+        row = self.id_to_row.get(chunk_id)
+        return None if row is None else np.array(self.vectors[row])
+
+    def memory_footprint(self) -> int:
+        """Bytes of mapped data this subject can pull into memory."""
+        size = self.vectors.nbytes + self.offsets.nbytes + len(self._chunk_data)
+        if self.index is not None:
+            size += (self.path / self.INDEX_FILE).stat().st_size
+        return int(size)
+
+    def similarity_search_with_score_by_vector(self, embedding, k: int = 4, **kwargs):
+        if not self.ids:
+            return []
+        distances, rows = search_index(self.index, self.vectors, embedding, k)
+        return [(self.get_document(int(row)), float(distance))
+                for distance, row in zip(distances[0], rows[0]) if row != -1]
+
+    def similarity_search_with_score(self, query: str, k: int = 4, **kwargs):
+        return self.similarity_search_with_score_by_vector(self.embedding.embed_query(query), k, **kwargs)
+
+    def similarity_search_by_vector(self, embedding, k: int = 4, **kwargs):
+        return [doc for doc, _ in self.similarity_search_with_score_by_vector(embedding, k, **kwargs)]
+
+    def similarity_search(self, query: str, k: int = 4, **kwargs):
+        return [doc for doc, _ in self.similarity_search_with_score(query, k, **kwargs)]
+
+    def add_texts(self, texts, metadatas=None, **kwargs):
+        raise NotImplementedError("MmapVectorStore is read-only; rebuild the subject with MmapVectorStore.write.")
+
+    @classmethod
+    def from_texts(cls, texts, embedding, metadatas=None, **kwargs):
+        raise NotImplementedError("Use MmapVectorStore.write followed by MmapVectorStore.load.")
+
+
+def _measure(loader, path: str, query_vector, result):
+    import psutil
+
+    process = psutil.Process()
+    before = process.memory_full_info()
+    start = time.perf_counter()
+    store = loader(path)
+    loaded = time.perf_counter()
+    store.similarity_search_with_score_by_vector(query_vector, k=2)
+    queried = time.perf_counter()
+    after = process.memory_full_info()
+    result.update({
+        "load_s": loaded - start,
+        "first_query_s": queried - loaded,
+        "rss_mb": (after.rss - before.rss) / 2 ** 20,
+        "uss_mb": (after.uss - before.uss) / 2 ** 20,
+    })
+
+
+def _load_mmap(path):
+    return MmapVectorStore.load(path, embedding=None)
+
+
+def _load_pickle(path):
+    from langchain_community.vectorstores import FAISS
+    from src.BRAIN.embedding_pipeline import HashEmbedder
+
+    return FAISS.load_local(path, HashEmbedder(), allow_dangerous_deserialization=True)
+
+
+def _measure_in_fresh_process(loader, path: str, query_vector):
+    import multiprocessing
+
+    ctx = multiprocessing.get_context("spawn")
+    with ctx.Manager() as manager:
+        result = manager.dict()
+        process = ctx.Process(target=_measure, args=(loader, path, query_vector, result))
+        process.start()
+        process.join()
+        return dict(result)
+
+
+if __name__ == "__main__":
+    # Cold-start time and memory of opening one subject, each format measured in a fresh process:
+    #   python -m src.BRAIN.mmap_store disaster
+    from src.BRAIN.RAG import RAGPipeline
+
+    subject = sys.argv[1] if len(sys.argv) > 1 else "disaster"
+    rag = RAGPipeline()
+    _, _, index_path = rag.get_paths(subject)
+    legacy_path = rag.get_legacy_vectorstore_path(subject)
+    if not MmapVectorStore.exists(index_path):
+        sys.exit(f"No index at {index_path}; ask a question on '{subject}' first to build it.")
+
+    store = MmapVectorStore.load(index_path, embedding=None)
+    query_vector = np.array(store.vectors[0]).tolist()
+    store.close()
+
+    print(f"mmap   {index_path}: {_measure_in_fresh_process(_load_mmap, str(index_path), query_vector)}")
+    if legacy_path.exists():
+        print(f"pickle {legacy_path}: {_measure_in_fresh_process(_load_pickle, str(legacy_path), query_vector)}")
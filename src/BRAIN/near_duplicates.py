@@ -0,0 +1,64 @@
+import hashlib
+import re
+import zlib
+
+import numpy as np
+
+PRIME = 4294967311  # Smallest prime above 2**32, so (a * x + b) % PRIME never overflows uint64
+NON_ALNUM = re.compile(r"[^0-9a-z]+")
+
+
+class MinHashLSH:
+    """MinHash signatures with LSH banding, for finding near-duplicate prompts without comparing all pairs.
+
+    A prompt is shingled into its words plus the character trigrams of its sorted words (the form
+    fuzz.token_sort_ratio compares), so reordering and typos keep most shingles. Prompts that agree
+    on every row of at least one band share a band key and become candidates. With 24 bands of 4
+    rows, pairs with a Jaccard similarity of 0.5 collide 79% of the time and pairs at 0.15 about
+    1%; exact fuzzy scoring then discards the false candidates.
+
+    A short prompt contained in a longer one ("My name is Ravi" / "My name is Ravi and I live in
+    Bangalore") has a low Jaccard similarity but a fuzzy token-set score of 100, so bands rarely
+    catch it. `word_keys` gives one key per word for that case; the store looks up only the
+    rarest of them.
+    """
+
+    def __init__(self, num_perm: int = 96, bands: int = 24, ngram: int = 3, seed: int = 1):
+        if num_perm % bands:
+            raise ValueError("num_perm must be a multiple of bands")
+        self.num_perm = num_perm
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.ngram = ngram
+        rng = np.random.default_rng(seed)
+        self._a = rng.integers(1, 2 ** 32, num_perm, dtype=np.uint64)
+        self._b = rng.integers(0, 2 ** 32, num_perm, dtype=np.uint64)
+
+    def shingles(self, text: str):
+        words = NON_ALNUM.sub(" ", text.lower()).split()
+        joined = " ".join(sorted(words))
+        grams = {joined[i:i + self.ngram] for i in range(len(joined) - self.ngram + 1)}
+        return set(words) | grams or {joined}
+
+    def signature(self, text: str) -> np.ndarray:
+        hashes = np.fromiter((zlib.crc32(s.encode("utf-8")) for s in self.shingles(text)), dtype=np.uint64)
+        return ((self._a[:, None] * hashes[None, :] + self._b[:, None]) % PRIME).min(axis=1)
+
+    def band_keys(self, text: str):
+        """One signed 64-bit key per band (SQLite INTEGER range); the band number is part of the key."""
+        bands = self.signature(text).reshape(self.bands, self.rows)
+        return [
+            int.from_bytes(hashlib.blake2b(bytes([i]) + band.tobytes(), digest_size=8).digest(), "little", signed=True)
+            for i, band in enumerate(bands)
+        ]
+
+    def words(self, text: str):
+        return sorted(set(NON_ALNUM.sub(" ", text.lower()).split()))
+
+    def word_keys(self, text: str):
+        """One signed 64-bit key per distinct word, hashed apart from the band keys."""
+        return [
+            int.from_bytes(hashlib.blake2b(word.encode("utf-8"), digest_size=8, person=b"word").digest(),
+                           "little", signed=True)
+            for word in self.words(text)
+        ]
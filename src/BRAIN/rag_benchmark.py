@@ -0,0 +1,165 @@
+import argparse
+import json
+import re
+import shutil
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+from langchain_core.language_models.llms import LLM
+
+from src.BRAIN.embedding_cache import CachedEmbeddings, EmbeddingCache
+from src.BRAIN.embedding_pipeline import HashEmbedder
+from src.BRAIN.RAG import RAGPipeline
+
+FIXTURE_PATH = Path("./DATA/rag_benchmark.json")
+KNOWLEDGE_DIR = Path("./DATA/KNOWLEDGEBASE")
+STAGES = ("condense", "cache", "table", "retrieve", "compress", "generate", "total")
+
+
+class ExtractiveLLM(LLM):
+    """Deterministic stand-in for the Ollama LLM, so the benchmark runs without a model server.
+
+    Condense prompts return the follow-up question unchanged and QA prompts return the first
+    sentence of the context. `delay` adds a fixed generation time per call.
+    """
+
+    delay: float = 0.0
+
+    @property
+    def _llm_type(self) -> str:
+        return "extractive-fake"
+
+    def _call(self, prompt: str, stop=None, run_manager=None, **kwargs) -> str:
+        if self.delay:
+            time.sleep(self.delay)
+        follow_up = re.search(r"Follow Up Input: (.*)\nStandalone question:", prompt, re.S)
+        if follow_up:
+            return follow_up.group(1).strip()
+        context = re.search(r"make up an answer\.\n\n(.*)\n\nQuestion:", prompt, re.S)
+        if context:
+            return re.split(r"(?<=[.!?])\s+", context.group(1).strip(), maxsplit=1)[0]
+        return prompt.strip().splitlines()[-1] if prompt.strip() else ""
+
+
+def normalize(text: str) -> str:
+    return " ".join(text.split())
+
+
+def percentiles(values):
+    if not values:
+        return {"p50": 0.0, "p95": 0.0, "p99": 0.0}
+    p50, p95, p99 = np.percentile(values, [50, 95, 99])
+    return {"p50": float(p50), "p95": float(p95), "p99": float(p99)}
+
+
+def get_backends(use_ollama: bool, cache_path, llm_delay: float):
+    if use_ollama:
+        from langchain_ollama import OllamaEmbeddings, OllamaLLM
+        from src.FUNCTION.Tools.get_env import EnvManager
+        model = EnvManager.load_variable("Embedding_model")
+        embedder = CachedEmbeddings(OllamaEmbeddings(model=model), model, cache=EmbeddingCache(cache_path))
+        return embedder, OllamaLLM(model=EnvManager.load_variable("Rag_model"), temperature=0)
+    return CachedEmbeddings(HashEmbedder(), "hash", cache=EmbeddingCache(cache_path)), ExtractiveLLM(delay=llm_delay)
+
+
+def run(fixture_path=FIXTURE_PATH, k_values=(1, 2, 5), repeat: int = 3, use_ollama: bool = False,
+        llm_delay: float = 0.0, retrieval_k: int = 2):
+    """Ingest each fixture subject into a scratch data directory, then measure retrieval and `ask`."""
+    with open(fixture_path, "r", encoding="utf-8") as f:
+        questions = json.load(f)["questions"]
+    by_subject = {}
+    for item in questions:
+        by_subject.setdefault(item["subject"], []).append(item)
+
+    k_values = sorted(set(k_values) | {retrieval_k})
+    report = {"backend": "ollama" if use_ollama else "offline", "retrieval_k": retrieval_k, "subjects": {}}
+    with tempfile.TemporaryDirectory() as data_dir:
+        data_dir = Path(data_dir)
+        (data_dir / "KNOWLEDGEBASE").mkdir()
+        embedder, llm = get_backends(use_ollama, data_dir / "embedding_cache.sqlite", llm_delay)
+        rag = RAGPipeline(embedder=embedder, llm=llm, data_dir=data_dir, retrieval_k=retrieval_k)
+
+        for subject, items in sorted(by_subject.items()):
+            _, md_path, _ = rag.get_paths(subject)
+            shutil.copy(KNOWLEDGE_DIR / md_path.name, md_path)
+
+            start = time.perf_counter()
+            store = rag.load_or_create_vectorstore(subject)
+            ingest_s = time.perf_counter() - start
+            index_bytes = sum(p.stat().st_size for p in store.path.iterdir() if p.is_file())
+            n_chunks = len(store.ids)
+            store.close()
+
+            chain = rag.setup_chain(subject)
+            chain.answer_cache = None  # Repeated questions should measure the full path
+            retriever = chain.retriever
+            recall = {}
+            for k in k_values:
+                retriever.k = k
+                hits = sum(
+                    any(item["answer_span"] in normalize(doc.page_content) for doc in retriever.invoke(item["question"]))
+                    for item in items
+                )
+                recall[f"recall@{k}"] = hits / len(items)
+            retriever.k = retrieval_k
+
+            timings = {stage: [] for stage in STAGES}
+            for round_ in range(repeat):
+                for i, item in enumerate(items):
+                    # A fresh session per question: every question is asked as the first turn.
+                    session_id = f"bench-{subject}-{round_}-{i}"
+                    rag.ask(chain, item["question"], session_id=session_id)
+                    for stage, seconds in chain.stats(session_id)["timings"].items():
+                        timings[stage].append(seconds * 1000)
+            rag.memory_store.clear()
+
+            report["subjects"][subject] = {
+                "questions": len(items),
+                "chunks": n_chunks,
+                "ingest_s": ingest_s,
+                "index_mb": index_bytes / 2 ** 20,
+                **recall,
+                "latency_ms": {stage: percentiles(values) for stage, values in timings.items() if values},
+            }
+    return report
+
+
+def print_report(report):
+    print(f"RAG benchmark ({report['backend']} backends)")
+    for subject, result in report["subjects"].items():
+        recall = "  ".join(f"{key}={value:.2f}" for key, value in result.items() if key.startswith("recall@"))
+        print(f"\n{subject}: {result['questions']} questions, {result['chunks']} chunks, "
+              f"ingest {result['ingest_s']:.2f}s, index {result['index_mb']:.2f} MB")
+        print(f"  {recall}")
+        print(f"  {'stage':10s} {'p50 ms':>9s} {'p95 ms':>9s} {'p99 ms':>9s}")
+        for stage, values in result["latency_ms"].items():
+            print(f"  {stage:10s} {values['p50']:9.2f} {values['p95']:9.2f} {values['p99']:9.2f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Ingestion time, index size, recall@k and per-stage latency of RAG.")
+    parser.add_argument("--fixture", default=str(FIXTURE_PATH))
+    parser.add_argument("--k", type=int, nargs="+", default=[1, 2, 5], help="k values for recall@k")
+    parser.add_argument("--retrieval-k", type=int, default=2, help="chunks the pipeline retrieves per question")
+    parser.add_argument("--repeat", type=int, default=3, help="times each question is asked")
+    parser.add_argument("--llm-delay", type=float, default=0.0, help="seconds the fake LLM waits per call")
+    parser.add_argument("--ollama", action="store_true", help="use the configured Ollama models instead of fakes")
+    parser.add_argument("--json", help="also write the report to this file")
+    parser.add_argument("--min-recall", type=float, default=None,
+                        help="exit non-zero if recall at the pipeline's k falls below this (for CI)")
+    args = parser.parse_args()
+
+    report = run(args.fixture, k_values=args.k, repeat=args.repeat, use_ollama=args.ollama,
+                 llm_delay=args.llm_delay, retrieval_k=args.retrieval_k)
+    print_report(report)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=4)
+    if args.min_recall is not None:
+        key = f"recall@{args.retrieval_k}"
+        low = {s: r[key] for s, r in report["subjects"].items() if r[key] < args.min_recall}
+        if low:
+            sys.exit(f"{key} below {args.min_recall}: {low}")
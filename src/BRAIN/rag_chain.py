@@ -0,0 +1,251 @@
+import re
+import threading
+import time
+from contextlib import contextmanager
+
+from langchain.chains.conversational_retrieval.prompts import CONDENSE_QUESTION_PROMPT, QA_PROMPT
+
+
+def format_chat_history(messages) -> str:
+    """Render messages the way ConversationalRetrievalChain does for its condense prompt."""
+    roles = {"human": "Human: ", "ai": "Assistant: ", "system": "Summary of earlier conversation: "}
+    return "".join(f"\n{roles.get(m.type, f'{m.type}: ')}{m.content}" for m in messages)
+
+
+# Words that usually point back at earlier turns ("what about its cause?", "and the second one?").
+FOLLOW_UP_WORDS = {
+    "it", "its", "it's", "this", "that", "these", "those", "they", "them", "their", "theirs",
+    "he", "him", "his", "she", "her", "hers", "there", "then", "former", "latter", "same",
+    "above", "previous", "earlier", "else", "more", "another", "other", "one", "ones",
+}
+FOLLOW_UP_OPENERS = ("and ", "also ", "but ", "so ", "what about", "how about", "why not", "what else", "then ")
+MIN_STANDALONE_WORDS = 4
+# A question must name what it is about to stand alone; "How many people died?" leans on earlier turns.
+PROPER_NOUN = re.compile(r"(?<!^)(?<![.?!] )\b(?!I\b)[A-Z][A-Za-z]+")
+DEFINITION = re.compile(
+    r"^(what|who) (is|are) (an? )?(?!the\b)[a-z'-]+( [a-z'-]+){0,3}\W*$|^(define|explain|describe) (?!the\b)[a-z]"
+)
+# A preposition followed by an indefinite noun ("causes of floods"), not a definite one ("in the flood").
+TOPIC_PHRASE = re.compile(
+    r"\b(of|in|on|for|about|from|during|between|to|with|by|against|after|before) (an? )?"
+    r"(?!(the|this|that|these|those|its|their|people|things?|ways?)\b)[a-z]{3,}"
+)
+
+
+def is_standalone(question: str) -> bool:
+    """Cheap check for questions that make sense without chat history, so the rewrite can be skipped."""
+    stripped = question.strip()
+    text = stripped.lower()
+    words = re.findall(r"[a-z']+", text)
+    if len(words) < MIN_STANDALONE_WORDS or text.startswith(FOLLOW_UP_OPENERS):
+        return False
+    if FOLLOW_UP_WORDS.intersection(words):
+        return False
+    return bool(PROPER_NOUN.search(stripped) or re.search(r"\d", text) or DEFINITION.match(text)
+                or TOPIC_PHRASE.search(text))
+
+
+class RAGChain:
+    """Conversational retrieval: condense the question against history, retrieve, then generate.
+
+    Same prompts and flow as ConversationalRetrievalChain, but with the steps exposed so the
+    answer can be streamed token by token.
+    """
+
+    def __init__(self, llm, retriever, get_session_history, subject: str = None,
+                 index_version: str = None, answer_cache=None, compressor=None, table_index=None, parts=None):
+        self.llm = llm
+        self.retriever = retriever
+        self.get_session_history = get_session_history
+        self.subject = subject
+        self.index_version = index_version  # Cached answers are only valid for this build of the index
+        self.answer_cache = answer_cache
+        self.compressor = compressor  # Optional ContextCompressor applied between retrieval and generation
+        self.table_index = table_index  # Optional TableIndex putting the matching table row in the context
+        self.parts = list(parts or [])  # Subject chains a combined chain borrows its retrievers from
+        # The chain is shared by every session, so what is reported to a user is kept per session id.
+        self.session_stats = {}  # session_id -> see `stats`
+        self.rewrites = 0  # All sessions; the average rewrite duration estimates what skipping saves
+        self.rewrite_time = 0.0
+        self._active = 0  # Questions currently being answered with this chain's indexes
+        self._closing = False
+        self._released = False
+        self._use_lock = threading.Lock()
+
+    def memory_footprint(self) -> int:
+        """Bytes of index data this chain keeps reachable."""
+        footprint = getattr(self.retriever, "memory_footprint", None)
+        return footprint() if footprint else 0
+
+    def pin(self):
+        """Keep the chain's indexes mapped until `unpin`, even if it is closed in between."""
+        with self._use_lock:
+            self._active += 1
+
+    def unpin(self):
+        with self._use_lock:
+            self._active -= 1
+            release = self._closing and not self._active
+        if release:
+            self._release()
+
+    @contextmanager
+    def _in_use(self):
+        chains = [self, *self.parts]
+        for chain in chains:
+            chain.pin()
+        try:
+            yield
+        finally:
+            for chain in chains:
+                chain.unpin()
+
+    def close(self):
+        """Unmap the chain's index files, or mark them to be unmapped once the questions in flight finish."""
+        with self._use_lock:
+            self._closing = True
+            if self._active:
+                return
+        self._release()
+
+    def _release(self):
+        with self._use_lock:
+            if self._released:
+                return
+            self._released = True
+        if self.parts:
+            return  # A combined chain owns nothing; its parts are closed by whoever loaded them
+        for resource in (self.retriever, self.table_index):
+            close = getattr(resource, "close", None)
+            if close:
+                close()
+
+    @staticmethod
+    def _session_id(config) -> str:
+        return ((config or {}).get("configurable") or {}).get("session_id", "default")
+
+    def stats(self, session_id: str = "default") -> dict:
+        """The session's last question ("ttft", "timings" per stage, in seconds) and its rewrite counts."""
+        return self.session_stats.get(session_id) or {
+            "ttft": None, "timings": {}, "rewrites": 0, "skipped_rewrites": 0, "latency_saved_s": 0.0,
+        }
+
+    def _start_stats(self, session_id: str) -> dict:
+        previous = self.stats(session_id)
+        stats = {**previous, "ttft": None, "timings": {}}
+        self.session_stats[session_id] = stats
+        return stats
+
+    def condense_question(self, question: str, history, stats: dict) -> str:
+        if not history.messages or is_standalone(question):
+            stats["skipped_rewrites"] += 1
+            stats["latency_saved_s"] += self.rewrite_time / self.rewrites if self.rewrites else 0.0
+            return question
+        start = time.perf_counter()
+        prompt = CONDENSE_QUESTION_PROMPT.format(
+            chat_history=format_chat_history(history.messages), question=question
+        )
+        standalone = self.llm.invoke(prompt).strip()
+        stats["rewrites"] += 1
+        self.rewrites += 1
+        self.rewrite_time += time.perf_counter() - start
+        return standalone
+
+    @staticmethod
+    def _timed(stats: dict, stage: str, start: float) -> float:
+        now = time.perf_counter()
+        stats["timings"][stage] = now - start
+        return now
+
+    def build_prompt(self, standalone: str, stats: dict) -> str:
+        """Prompt over the retrieved (and compressed) context, led by the best matching table row if any."""
+        table_row = None
+        if self.table_index:
+            start = time.perf_counter()
+            table_row = self.table_index.match(standalone)
+            self._timed(stats, "table", start)
+        start = time.perf_counter()
+        docs = self.retriever.invoke(standalone)
+        start = self._timed(stats, "retrieve", start)
+        if self.compressor:
+            context = self.compressor.compress(standalone, docs)
+        else:
+            context = "\n\n".join(doc.page_content for doc in docs)
+        self._timed(stats, "compress", start)
+        if table_row:
+            context = f"{table_row}\n\n{context}"
+        return QA_PROMPT.format(context=context, question=standalone)
+
+    def cached_answer(self, standalone: str, stats: dict):
+        """Answer without generation from the semantic answer cache, or None."""
+        if not self.answer_cache:
+            return None
+        start = time.perf_counter()
+        answer = self.answer_cache.lookup(self.subject, self.index_version, standalone)
+        self._timed(stats, "cache", start)
+        return answer
+
+    def remember(self, history, question: str, standalone: str, answer: str, cached: bool = False):
+        history.add_user_message(question)
+        history.add_ai_message(answer)
+        if self.answer_cache and answer and not cached:
+            self.answer_cache.store(self.subject, self.index_version, standalone, answer)
+
+    def invoke(self, inputs: dict, config: dict = None) -> dict:
+        with self._in_use():
+            return self._invoke(inputs, config)
+
+    def _invoke(self, inputs: dict, config: dict = None) -> dict:
+        start = time.perf_counter()
+        session_id = self._session_id(config)
+        stats = self._start_stats(session_id)
+        question = inputs["question"]
+        history = self.get_session_history(session_id)
+        standalone = self.condense_question(question, history, stats)
+        self._timed(stats, "condense", start)
+        answer = self.cached_answer(standalone, stats)
+        cached = answer is not None
+        if not cached:
+            prompt = self.build_prompt(standalone, stats)
+            generate_start = time.perf_counter()
+            answer = self.llm.invoke(prompt).strip()
+            self._timed(stats, "generate", generate_start)
+        self.remember(history, question, standalone, answer, cached)
+        self._timed(stats, "total", start)
+        return {"question": question, "answer": answer}
+
+    def stream(self, inputs: dict, config: dict = None):
+        """Yield answer tokens as the LLM produces them; history is updated once the answer is complete."""
+        with self._in_use():
+            yield from self._stream(inputs, config)
+
+    def _stream(self, inputs: dict, config: dict = None):
+        start = time.perf_counter()
+        session_id = self._session_id(config)
+        stats = self._start_stats(session_id)
+        question = inputs["question"]
+        history = self.get_session_history(session_id)
+        standalone = self.condense_question(question, history, stats)
+        self._timed(stats, "condense", start)
+
+        answer = self.cached_answer(standalone, stats)
+        if answer is not None:
+            stats["ttft"] = time.perf_counter() - start
+            print(f"[RAG] Answered without generation in {stats['ttft']:.3f}s")
+            yield answer
+            self.remember(history, question, standalone, answer, cached=True)
+            return
+
+        prompt = self.build_prompt(standalone, stats)
+        generate_start = time.perf_counter()
+        parts = []
+        for token in self.llm.stream(prompt):
+            if stats["ttft"] is None:
+                stats["ttft"] = time.perf_counter() - start
+                print(f"[RAG] Time to first token: {stats['ttft']:.2f}s")
+            parts.append(token)
+            yield token
+
+        self._timed(stats, "generate", generate_start)
+        self.remember(history, question, standalone, "".join(parts).strip())
+        self._timed(stats, "total", start)
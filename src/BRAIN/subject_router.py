@@ -0,0 +1,96 @@
+from collections import defaultdict
+from pathlib import Path
+
+import numpy as np
+from langchain_core.retrievers import BaseRetriever
+
+from src.BRAIN.mmap_store import MmapVectorStore
+
+CENTROID_FILE = "centroid.npy"
+INDEX_SUFFIX = "_index"
+
+
+def compute_centroid(vectors) -> np.ndarray:
+    """Unit-length mean of the unit-normalized chunk vectors of one subject."""
+    vectors = np.asarray(vectors, dtype=np.float32)
+    if not len(vectors):
+        return np.zeros(vectors.shape[-1] if vectors.ndim == 2 else 0, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True) + 1e-12
+    centroid = (vectors / norms).mean(axis=0)
+    return (centroid / (np.linalg.norm(centroid) + 1e-12)).astype(np.float32)
+
+
+class SubjectRouter:
+    """Picks the subject indexes a question should be sent to by comparing it with each subject centroid.
+
+    Centroids are read from `centroid.npy` in each `{subject}_index` directory (computed from
+    `vectors.npy` for indexes written before centroids existed) and reloaded when an index changes.
+    """
+
+    def __init__(self, embedder, index_dir="./DATA/VECTORSTORES", top_n: int = 2, second_ratio: float = 0.9):
+        self.embedder = embedder
+        self.index_dir = Path(index_dir)
+        self.top_n = top_n
+        self.second_ratio = second_ratio  # Also query the runner-up only if it scores this close to the best
+        self._centroids = {}  # subject -> ((vectors.npy path, mtime), centroid)
+
+    def refresh(self):
+        found = {}
+        for index_path in sorted(self.index_dir.glob(f"*{INDEX_SUFFIX}")):
+            vectors_path = MmapVectorStore.resolve(index_path) / MmapVectorStore.VECTORS_FILE
+            if not vectors_path.exists():
+                continue
+            subject = index_path.name[:-len(INDEX_SUFFIX)]
+            stamp = (vectors_path, vectors_path.stat().st_mtime_ns)
+            cached = self._centroids.get(subject)
+            if cached and cached[0] == stamp:
+                found[subject] = cached
+                continue
+            centroid_path = vectors_path.parent / CENTROID_FILE
+            if centroid_path.exists():
+                centroid = np.load(centroid_path)
+            else:
+                centroid = compute_centroid(np.load(vectors_path, mmap_mode="r"))
+            found[subject] = (stamp, centroid)
+        self._centroids = found
+        return list(found)
+
+    def scores(self, question: str) -> dict:
+        self.refresh()
+        if not self._centroids:
+            return {}
+        subjects = list(self._centroids)
+        matrix = np.vstack([self._centroids[s][1] for s in subjects])
+        query = np.asarray(self.embedder.embed_query(question), dtype=np.float32)
+        similarity = matrix @ (query / (np.linalg.norm(query) + 1e-12))
+        return dict(zip(subjects, similarity.tolist()))
+
+    def route(self, question: str):
+        """Best matching subjects, most similar first: the top one plus runners-up that score close to it."""
+        ranked = sorted(self.scores(question).items(), key=lambda item: item[1], reverse=True)[:self.top_n]
+        if not ranked:
+            return []
+        best = ranked[0][1]
+        return [subject for subject, score in ranked if score >= best * self.second_ratio or subject == ranked[0][0]]
+
+
+class ShardedRetriever(BaseRetriever):
+    """Fuses the results of several subject retrievers with reciprocal rank fusion."""
+
+    retrievers: list
+    k: int = 2
+    rrf_k: int = 60
+
+    def memory_footprint(self) -> int:
+        return sum(getattr(r, "memory_footprint", lambda: 0)() for r in self.retrievers)
+
+    def _get_relevant_documents(self, query: str, *, run_manager=None):
+        fused = defaultdict(float)
+        docs = {}
+        for shard, retriever in enumerate(self.retrievers):
+            for rank, doc in enumerate(retriever.invoke(query)):
+                key = (shard, doc.id or doc.page_content)
+                docs[key] = doc
+                fused[key] += 1 / (self.rrf_k + rank + 1)
+        ranked = sorted(fused, key=fused.get, reverse=True)[:self.k]
+        return [docs[key] for key in ranked]
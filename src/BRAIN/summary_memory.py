@@ -0,0 +1,59 @@
+from langchain.memory.prompt import SUMMARY_PROMPT
+from langchain_core.chat_history import BaseChatMessageHistory
+from langchain_core.messages import SystemMessage, get_buffer_string
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count (~4 characters per token); cheap enough to run on every turn."""
+    return max(1, len(text) // 4) if text else 0
+
+
+class SummaryBufferHistory(BaseChatMessageHistory):
+    """Chat history that keeps recent turns verbatim within a token budget.
+
+    Once the verbatim turns exceed `max_tokens`, the oldest ones are folded into a
+    rolling summary by the LLM until they are back under `max_tokens * refill_ratio`,
+    so summarizing happens every few turns rather than on each one. `messages`
+    returns the summary (as a system message) followed by the verbatim turns.
+    """
+
+    def __init__(self, llm, max_tokens: int = 1000, refill_ratio: float = 0.6):
+        self.llm = llm
+        self.max_tokens = max_tokens
+        self.refill_ratio = refill_ratio
+        self.summary = ""
+        self.buffer = []
+
+    @property
+    def messages(self):
+        if not self.summary:
+            return list(self.buffer)
+        return [SystemMessage(content=self.summary)] + self.buffer
+
+    def buffer_tokens(self) -> int:
+        return sum(estimate_tokens(message.content) for message in self.buffer)
+
+    def add_message(self, message):
+        self.buffer.append(message)
+        if self.buffer_tokens() > self.max_tokens:
+            self.fold()
+
+    def fold(self):
+        """Move the oldest turns into the summary, keeping at least the latest exchange verbatim."""
+        target = int(self.max_tokens * self.refill_ratio)
+        folded = []
+        while len(self.buffer) > 2 and self.buffer_tokens() > target:
+            folded.extend(self.buffer[:2])
+            del self.buffer[:2]
+        if not folded:
+            return
+        prompt = SUMMARY_PROMPT.format(summary=self.summary, new_lines=get_buffer_string(folded))
+        try:
+            self.summary = self.llm.invoke(prompt).strip()
+        except Exception as e:
+            # Keep the conversation going; the folded turns are simply dropped.
+            print(f"[Memory Error] Could not summarize history: {e}")
+
+    def clear(self):
+        self.summary = ""
+        self.buffer = []
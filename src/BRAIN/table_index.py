@@ -0,0 +1,157 @@
+import html
+import json
+import re
+import sqlite3
+from pathlib import Path
+
+from src.BRAIN.lexical_index import BM25Index
+
+# Questions asking for a figure, date or specific entry; others go to the LLM.
+LOOKUP_QUESTION = re.compile(
+    r"\b(how (many|much|long|far|old|big|large)|what (percent|percentage|number|amount|year|date|is the (rate|number|amount))"
+    r"|when|which year|number of|total|median|average|rate|cost|salary|pay|died|killed|deaths?|toll)\b",
+    re.I,
+)
+STOPWORDS = {
+    "a", "an", "the", "of", "in", "on", "at", "to", "for", "by", "and", "or", "is", "are", "was", "were", "be",
+    "did", "do", "does", "how", "many", "much", "what", "which", "when", "who", "whom", "where", "why", "there",
+    "that", "this", "with", "from", "as", "it", "its", "s", "about", "per", "give", "me", "tell", "list",
+}
+SEPARATOR_CELL = re.compile(r"^:?-{3,}:?$")
+NUMBER = re.compile(r"-?\d+(?:,\d{3})*(?:\.\d+)?")
+# A cell holding only a figure or date ("7,928", "2.", "25.85", "11.12.2008", "12%"); header rows have none.
+VALUE_CELL = re.compile(r"^[(\[]?-?\d[\d,./:-]*[)\].]?\s*%?$")
+
+
+def split_row(line: str):
+    cells = line.strip()
+    if cells.startswith("|"):
+        cells = cells[1:]
+    if cells.endswith("|"):
+        cells = cells[:-1]
+    return [" ".join(html.unescape(cell).split()) for cell in cells.split("|")]
+
+
+def parse_number(value: str):
+    match = NUMBER.search(value)
+    return float(match.group().replace(",", "")) if match else None
+
+
+class TableIndex:
+    """Markdown tables of one subject, extracted into SQLite so the row a figure question is about can be found.
+
+    `tables` holds each table's section and column names, `cells` one row per cell with its
+    numeric value, and the `rows` FTS5 table the text of each row for lookups.
+
+    The row only goes into the LLM's context, labelled with its column names: a row that
+    matches the question's terms can still hold a different figure than the one asked for
+    (the date of an amendment for "When was the Act passed?"). Rows whose cells contain
+    every distinctive term of the question (numbers, proper nouns and words found in few
+    rows) are preferred, and header rows that docling left in the body are skipped.
+    """
+
+    FILE_NAME = "tables.sqlite"
+
+    def __init__(self, path, min_coverage: float = 0.6, rare_fraction: float = 0.01):
+        self.path = Path(path)
+        self.min_coverage = min_coverage  # Share of the question's terms a row must contain to be used
+        self.rare_fraction = rare_fraction  # Terms in the cells of at most this share of rows are distinctive
+        self._conn = sqlite3.connect(f"file:{self.path.as_posix()}?mode=ro", uri=True, check_same_thread=False)
+        self.row_count = self._conn.execute("SELECT COUNT(*) FROM rows").fetchone()[0]
+        self.lookups = 0
+        self.matched = 0
+
+    @classmethod
+    def build(cls, path, text: str, chunker):
+        """Extract every table of `text` (docling markdown) into a new SQLite file at `path`."""
+        conn = sqlite3.connect(str(path))
+        conn.executescript("""
+            CREATE TABLE tables (id INTEGER PRIMARY KEY, section TEXT, columns TEXT, start_index INTEGER, end_index INTEGER);
+            CREATE TABLE cells (table_id INTEGER, row INTEGER, col INTEGER, value TEXT, number REAL);
+            CREATE VIRTUAL TABLE rows USING fts5(cells, context, table_id UNINDEXED, row UNINDEXED);
+        """)
+        previous = None  # (section, columns) of the last table, for tables split across pages
+        for table_id, (start, end, section) in enumerate(chunker.tables(text)):
+            lines = [split_row(line) for line in text[start:end].splitlines()]
+            rows = [cells for cells in lines if not all(SEPARATOR_CELL.match(c) for c in cells if c)]
+            if not rows:
+                continue
+            columns, data = rows[0], rows[1:]
+            if previous and previous[0] == section and len(previous[1]) == len(columns) \
+                    and any(NUMBER.match(c) for c in columns):
+                # Docling starts a page's continuation of a table as a new table, its first row as the header.
+                columns, data = previous[1], rows
+            previous = (section, columns)
+            conn.execute("INSERT INTO tables VALUES (?, ?, ?, ?, ?)", (table_id, section, json.dumps(columns), start, end))
+            for row, cells in enumerate(data):
+                conn.executemany("INSERT INTO cells VALUES (?, ?, ?, ?, ?)",
+                                 [(table_id, row, col, value, parse_number(value)) for col, value in enumerate(cells)])
+                conn.execute("INSERT INTO rows VALUES (?, ?, ?, ?)",
+                             (" | ".join(cells), f"{section} {' '.join(columns)}", table_id, row))
+        conn.commit()
+        conn.close()
+
+    @classmethod
+    def open(cls, directory):
+        path = Path(directory) / cls.FILE_NAME
+        return cls(path) if path.exists() else None
+
+    def close(self):
+        self._conn.close()
+
+    def distinctive_terms(self, question: str, terms):
+        """Numbers, capitalized words after the first, and terms that few rows have in their cells."""
+        named = BM25Index.named_terms(question)
+        result = []
+        for term in terms:
+            if term in named or any(ch.isdigit() for ch in term):
+                result.append(term)
+                continue
+            rows = self._conn.execute("SELECT COUNT(*) FROM rows WHERE rows MATCH ?", (f'cells:"{term}"',)).fetchone()[0]
+            if 0 < rows <= self.rare_fraction * self.row_count:
+                result.append(term)
+        return result
+
+    def match(self, question: str):
+        """Text of the table row that best matches a figure or lookup question, or None."""
+        if not LOOKUP_QUESTION.search(question):
+            return None
+        terms = [t for t in dict.fromkeys(BM25Index.tokenize(question)) if t not in STOPWORDS]
+        if not terms:
+            return None
+        self.lookups += 1
+        query = " OR ".join(f'"{term}"' for term in terms)
+        candidates = self._conn.execute(
+            "SELECT table_id, row, cells, context FROM rows WHERE rows MATCH ? ORDER BY bm25(rows, 1.0, 0.2) LIMIT 20",
+            (query,),
+        ).fetchall()
+        required = self.distinctive_terms(question, terms)
+
+        best, best_rank = None, (False, 0)
+        for table_id, row, cells, context in candidates:
+            if not any(VALUE_CELL.match(cell) for cell in cells.split(" | ")):
+                continue
+            tokens = set(BM25Index.tokenize(f"{cells} {context}"))
+            matched = sum(term in tokens for term in terms)
+            complete = set(required) <= set(BM25Index.tokenize(cells))
+            if (complete, matched) > best_rank:
+                best, best_rank = (table_id, row), (complete, matched)
+        matched = best_rank[1]
+        if best is None or matched < min(2, len(terms)) or matched / len(terms) < self.min_coverage:
+            return None
+        self.matched += 1
+        return self.format_row(*best)
+
+    def format_row(self, table_id: int, row: int) -> str:
+        section, columns = self._conn.execute("SELECT section, columns FROM tables WHERE id = ?", (table_id,)).fetchone()
+        columns = json.loads(columns)
+        values = [value for (value,) in self._conn.execute(
+            "SELECT value FROM cells WHERE table_id = ? AND row = ? ORDER BY col", (table_id, row))]
+        pairs, seen = [], set()
+        for col, value in enumerate(values):
+            name = columns[col] if col < len(columns) else ""
+            if value and value not in seen:
+                seen.add(value)
+                pairs.append(f"{name}: {value}" if name and name != value else value)
+        where = f" (table in '{section}')" if section else ""
+        return "; ".join(pairs) + where
@@ -6,6 +6,8 @@ from langchain_ollama import ChatOllama
 import torch
 import io 
 import base64
+import uuid
+from contextlib import contextmanager
 
 # ----- Custom Modules -----
 from src.FUNCTION.run_function import FunctionExecutor
@@ -18,6 +20,8 @@ from DATA.msg import WELCOME_RESPONSES
 from src.BRAIN.gem_func_call import GeminiFunctionCaller
 from src.BRAIN.RAG import RAGPipeline
 from src.BRAIN.chat_with_ai import PersonalChatAI
+from src.BRAIN.index_pool import IndexPool
+from src.BRAIN.memory_writer import MemoryWriter
 from src.CONVERSATION.text_speech import text_to_speech_local
 from src.CONVERSATION.voice_text import voice_to_text
 from src.BRAIN.code_gen import CodeRefactorAssistant
@@ -34,8 +38,23 @@ local_caller = LocalFunctionCall()
 func_executor = FunctionExecutor()
 time_greeter = TimeOfDay()
 code_assistant = CodeRefactorAssistant()
-chat_ai = PersonalChatAI()
-rag = RAGPipeline()
+
+
+@st.cache_resource(show_spinner=False)
+def get_chat_ai():
+    # Opens the memory store and fits the importance classifier on its decision log; once per server, not per rerun.
+    return PersonalChatAI()
+
+chat_ai = get_chat_ai()
+
+
+@st.cache_resource(show_spinner=False)
+def get_rag_pipeline():
+    # Streamlit re-runs this script on every interaction; routes, combined chains and
+    # conversation memory must outlive a rerun.
+    return RAGPipeline()
+
+rag = get_rag_pipeline()
 
 # ----- Streamlit config -----
 os.environ["STREAMLIT_WATCHER_TYPE"] = "none"
@@ -43,6 +62,8 @@ UPLOAD_DIR = "."
 os.makedirs(UPLOAD_DIR, exist_ok=True)
 
 AI_MODEL = "granite3.1-dense:2b"
+RAG_MEMORY_BUDGET_MB = 1024  # Loaded subject indexes beyond this are evicted, least recently used first
+AUTO_SUBJECT = "Auto"  # Let the subject router pick the knowledge bases for each question
 
 # ----- Session Initialization -----
 def initialize_session():
@@ -61,7 +82,8 @@ def initialize_session():
         "audio_input_key_counter": 0,
         "image_path": None,
         "image_obj": None,
-        "image_action": None
+        "image_action": None,
+        "rag_session_id": uuid.uuid4().hex,  # Keeps RAG memory and routes apart between browser sessions
     }
     for k, v in defaults.items():
         if k not in st.session_state:
@@ -83,20 +105,28 @@ if "greeting_message" in st.session_state:
     del st.session_state["greeting_message"]
 
 # ----- Utility Functions -----
-@st.cache_resource(show_spinner=False)
 def load_rag_chain(subject):
     try:
-        return rag.setup_chain(subject.lower().strip().replace(" ", "_"))
+        return rag.setup_chain(subject)
     except:
         return None
 
+@st.cache_resource(show_spinner=False)
+def get_index_pool():
+    return IndexPool(load_rag_chain, memory_budget_mb=RAG_MEMORY_BUDGET_MB, version_of=rag.index_version)
+
+@st.cache_resource(show_spinner=False)
+def get_memory_writer():
+    # One writer thread for all sessions; it flushes pending memories when the server exits.
+    return MemoryWriter(chat_ai.store_important_chat)
+
 @st.cache_data(show_spinner=False)
 def personal_chat_ai(query, max_token=2000):
     try:
         messages = chat_ai.message_management(query)
         llm = ChatOllama(model=AI_MODEL, temperature=0.3, max_token=max_token)
         response_content = "".join(chunk.content for chunk in llm.stream(messages))
-        chat_ai.store_important_chat(query, response_content)
+        get_memory_writer().submit(query, response_content)
         return response_content
     except Exception as e:
         return f"An error occurred: {e}"
@@ -107,12 +137,39 @@ def data_analysis(user_prompt: str, file_path: str):
     except:
         return code_assistant.local_text_to_code(user_prompt, file_path)
 
+@contextmanager
+def rag_chain(subject, query=None):
+    """The chain to answer `query` with, or None; the pool keeps its indexes open until the block exits."""
+    if subject == AUTO_SUBJECT:
+        # Route the question to the closest subject indexes instead of a picked one.
+        subjects = rag.route(query, session_id=st.session_state.rag_session_id)
+    else:
+        subjects = [subject.lower().strip().replace(" ", "_")]
+    with get_index_pool().lease(subjects) as chains:
+        loaded = [(s, chain) for s, chain in zip(subjects, chains) if chain]
+        if not loaded:
+            yield None
+        elif subject == AUTO_SUBJECT:
+            yield rag.combine_chains([s for s, _ in loaded], [chain for _, chain in loaded])
+        else:
+            yield loaded[0][1]
+
 def chat_with_rag_session(subject, query):
-    key = subject.lower().strip().replace(" ", "_")
-    if f"qa_chain_{key}" not in st.session_state:
-        st.session_state[f"qa_chain_{key}"] = load_rag_chain(key)
-    qa_chain = st.session_state.get(f"qa_chain_{key}")
-    return rag.ask(qa_chain, query) if qa_chain else f"Error: Unable to load RAG chain for '{subject}'."
+    with rag_chain(subject, query) as qa_chain:
+        return rag.ask(qa_chain, query, session_id=st.session_state.rag_session_id) if qa_chain else f"Error: Unable to load RAG chain for '{subject}'."
+
+def stream_rag_session(subject, query):
+    """Render the RAG answer progressively in an assistant bubble and return the full text."""
+    with rag_chain(subject, query) as qa_chain:
+        if not qa_chain:
+            return None
+        with st.chat_message("assistant"):
+            response = st.write_stream(rag.ask_stream(qa_chain, query, session_id=st.session_state.rag_session_id))
+            stats = qa_chain.stats(st.session_state.rag_session_id)
+            if stats["ttft"] is not None:
+                st.caption(f"⏱️ First token in {stats['ttft']:.2f}s · rewrites skipped "
+                           f"{stats['skipped_rewrites']} (~{stats['latency_saved_s']:.1f}s saved)")
+        return response
 
 def process_command(command):
     try:
@@ -162,9 +219,24 @@ st.session_state.voice_output = st.sidebar.toggle("🎙️ Voice Reply", value=s
 # RAG topic select
 if st.session_state.chat_mode == "chat_with_rag":
     st.session_state.rag_subject = st.sidebar.selectbox("📘 Select RAG Topic", [
-        "Disaster", "Finance", "Healthcare", "Artificial Intelligence", "Climate Change",
+        AUTO_SUBJECT, "Disaster", "Finance", "Healthcare", "Artificial Intelligence", "Climate Change",
         "Cybersecurity", "Education", "Space Technology", "Politics", "History", "Biology"
     ])
+    pool_stats = get_index_pool().stats()
+    st.sidebar.caption(
+        f"🗂️ Indexes loaded: {len(pool_stats['subjects'])} ({pool_stats['resident_mb']:.0f}/{RAG_MEMORY_BUDGET_MB} MB) · "
+        f"hits {pool_stats['hits']} · misses {pool_stats['misses']} · evictions {pool_stats['evictions']} · reloads {pool_stats['reloads']}"
+    )
+
+# Importance classifier stats
+if st.session_state.chat_mode == "chat_with_ai":
+    importance_stats = chat_ai.importance.stats()
+    agreement = importance_stats["agreement"]
+    st.sidebar.caption(
+        f"🧠 Memory checks: {importance_stats['decisions']} · LLM calls avoided {importance_stats['avoided']:.0%} · "
+        f"agreement with LLM {'n/a' if agreement is None else f'{agreement:.0%}'} ({importance_stats['audited']} audited) · "
+        f"pending writes {get_memory_writer().stats()['pending']}"
+    )
 
 # Data Analysis upload
 if st.session_state.chat_mode == "data_analysis":
@@ -232,11 +304,18 @@ if user_input := st.chat_input("Ask me anything... "):
     add_message("user", user_input)
 
     # --- Mode handling ---
+    streamed = False
     if st.session_state.chat_mode == "chat_with_ai":
         response = personal_chat_ai(user_input)
     elif st.session_state.chat_mode == "chat_with_rag":
         subject = st.session_state.rag_subject
-        response = chat_with_rag_session(subject, user_input) if subject else "🚨 Enter a subject."
+        if not subject:
+            response = "🚨 Enter a subject."
+        else:
+            response = stream_rag_session(subject, user_input)
+            streamed = response is not None
+            if not streamed:
+                response = f"Error: Unable to load RAG chain for '{subject}'."
     elif st.session_state.chat_mode == "data_analysis":
         if not st.session_state.uploaded_file_path:
             response = "🚨 Please upload a CSV first."
@@ -287,6 +366,8 @@ if user_input := st.chat_input("Ask me anything... "):
                 **📜 Output:** *{entry.get('output', 'No output.')}*
                 """)
         add_message("assistant", json.dumps(response, indent=2))
+    elif streamed:
+        add_message("assistant", response)
     else:
         st.chat_message("assistant").markdown(response)
         add_message("assistant", response)